@@ -12,15 +12,12 @@ __version__ = '$Id: b4346158b848e2e6a17503fa3635f9a21f76c533 $'
 
 import datetime
 import difflib
+import heapq
+import itertools
 import math
 import re
-import sys
 import threading
-
-if sys.version_info[0] == 2:
-    from Queue import Queue
-else:
-    from queue import Queue
+import time
 
 # Use pywikibot. prefix for all in-package imports; this is to prevent
 # confusion with similarly-named modules in version 1 framework, for users
@@ -627,36 +624,32 @@ def stopme():
     if not stopped:
         debug(u"stopme() called", _logger)
 
-        def remaining():
-            remainingPages = page_put_queue.qsize() - 1
-            # -1 because we added a None element to stop the queue
-
-            remainingSeconds = datetime.timedelta(
-                seconds=(remainingPages * config.put_throttle))
-            return (remainingPages, remainingSeconds)
-
-        page_put_queue.put((None, [], {}))
         stopped = True
 
-        if page_put_queue.qsize() > 1:
-            num, sec = remaining()
+        if page_put_queue.qsize():
+            num, sec = page_put_queue.remaining()
             format_values = dict(num=num, sec=sec)
             output(u'\03{lightblue}'
                    u'Waiting for %(num)i pages to be put. '
                    u'Estimated time remaining: %(sec)s'
                    u'\03{default}' % format_values)
 
-        while(_putthread.isAlive()):
+        while True:
             try:
-                _putthread.join(1)
+                if page_put_queue.join(1):
+                    break
             except KeyboardInterrupt:
                 answer = inputChoice(u"""\
 There are %i pages remaining in the queue. Estimated time remaining: %s
-Really exit?""" % remaining(),
+Really exit?""" % page_put_queue.remaining(),
                     ['yes', 'no'], ['y', 'N'], 'N')
                 if answer == 'y':
                     return
 
+        from pywikibot import stats
+        if stats.enabled:
+            stats.dump()
+
     # only need one drop() call because all throttles use the same global pid
     try:
         list(_sites.values())[0].throttle.drop()
@@ -668,33 +661,247 @@ import atexit
 atexit.register(stopme)
 
 
-# Create a separate thread for asynchronous page saves (and other requests)
-def async_manager():
-    """Daemon; take requests from the queue and execute them in background."""
-    while True:
-        (request, args, kwargs) = page_put_queue.get()
-        if request is None:
-            break
-        request(*args, **kwargs)
+# Execute asynchronous page saves (and other requests) in background threads
+class SaveScheduler(object):
 
+    """Execute requests like page saves in background threads.
 
-def async_request(request, *args, **kwargs):
-    """Put a request on the queue, and start the daemon if necessary."""
-    if not _putthread.isAlive():
+    The requests for a site are executed one after another, those with a
+    higher priority first and otherwise in the order they were submitted.
+    A request never overtakes an earlier request with the same key (e.g.
+    the same page), even if it has a higher priority. The requests for up
+    to 'workers' sites are executed at the same time.
+
+    If maxsize is positive, submitting a request blocks while maxsize
+    requests are pending.
+
+    """
+
+    def __init__(self, workers=1, maxsize=0):
+        """Constructor.
+
+        @param workers: the maximum number of threads
+        @type workers: int
+        @param maxsize: the maximum number of pending requests
+        @type maxsize: int
+
+        """
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.cond = threading.Condition()
+        # heaps of (-priority, number, key, request, args, kwargs) by site
+        self.queues = {}
+        # sites whose requests are being executed
+        self.busy = set()
+        # number of pending requests and priority of the last one by key
+        self.keys = {}
+        self.counter = itertools.count()
+        self.threads = []
+        self.idle = 0
+        # metrics
+        self.pending = 0
+        self.submitted = 0
+        self.done = 0
+        self.failed = 0
+        self.blocked = 0.0
+        self.durations = {}
+
+    def put(self, request, args=(), kwargs={}, site=None, key=None,
+            priority=0):
+        """Schedule request(*args, **kwargs).
+
+        @param site: the site the request is made to; the requests without
+            a site are executed one after another, too
+        @param key: requests with the same key are executed in the order
+            they were submitted
+        @param priority: requests with a higher priority are executed first
+        @type priority: int
+
+        """
+        self.cond.acquire()
         try:
-            page_put_queue.mutex.acquire()
-            try:
-                _putthread.start()
-            except (AssertionError, RuntimeError):
-                pass
+            if self.maxsize > 0 and self.pending >= self.maxsize:
+                started = time.time()
+                while self.pending >= self.maxsize:
+                    self.cond.wait()
+                self.blocked += time.time() - started
+            if key is not None:
+                if key in self.keys:
+                    count, last = self.keys[key]
+                    priority = min(priority, last)
+                    self.keys[key] = (count + 1, priority)
+                else:
+                    self.keys[key] = (1, priority)
+            heapq.heappush(self.queues.setdefault(site, []),
+                           (-priority, next(self.counter), key,
+                            request, args, kwargs))
+            self.pending += 1
+            self.submitted += 1
+            if not self.idle and len(self.threads) < self.workers:
+                self._start_thread()
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def _start_thread(self):
+        """Start another worker thread; the caller holds self.cond."""
+        thread = threading.Thread(target=self._work,
+                                  name="Put-Thread-%d" % len(self.threads))
+        thread.setDaemon(True)
+        self.threads.append(thread)
+        thread.start()
+
+    def _work(self):
+        self.cond.acquire()
+        try:
+            while True:
+                sites = [site for site in self.queues
+                         if site not in self.busy]
+                if not sites:
+                    self.idle += 1
+                    self.cond.wait()
+                    self.idle -= 1
+                    continue
+                # take the most urgent request of a site which is not busy
+                site = min(sites, key=lambda site: self.queues[site][0][:2])
+                queue = self.queues[site]
+                (priority, number, key,
+                 request, args, kwargs) = heapq.heappop(queue)
+                if not queue:
+                    del self.queues[site]
+                self.busy.add(site)
+                self.cond.release()
+                started = time.time()
+                # also set if request raises e.g. KeyboardInterrupt or
+                # SystemExit, which ends this thread below
+                failed = True
+                try:
+                    request(*args, **kwargs)
+                    failed = False
+                except Exception:
+                    exception(u"Error executing asynchronous request %r"
+                              % request)
+                finally:
+                    duration = time.time() - started
+                    self.cond.acquire()
+                    self.busy.discard(site)
+                    count, total = self.durations.get(site, (0, 0.0))
+                    self.durations[site] = (count + 1, total + duration)
+                    if key is not None:
+                        count, last = self.keys[key]
+                        if count > 1:
+                            self.keys[key] = (count - 1, last)
+                        else:
+                            del self.keys[key]
+                    self.pending -= 1
+                    self.done += 1
+                    self.failed += failed
+                    self.cond.notifyAll()
         finally:
-            page_put_queue.mutex.release()
-    page_put_queue.put((request, args, kwargs))
-
-# queue to hold pending requests
-page_put_queue = Queue(config.max_queue_size)
-# set up the background thread
-_putthread = threading.Thread(target=async_manager)
-# identification for debugging purposes
-_putthread.setName('Put-Thread')
-_putthread.setDaemon(True)
+            # this thread ends because of an exception; let another one
+            # execute the remaining requests
+            self.threads.remove(threading.currentThread())
+            if self.queues and not self.idle:
+                self._start_thread()
+            self.cond.release()
+
+    def qsize(self):
+        """Return the number of pending requests."""
+        return self.pending
+
+    def remaining(self):
+        """Return the number of pending requests and the estimated time.
+
+        The time is estimated from the average duration of the requests
+        done so far for each site, or config.put_throttle.
+
+        @rtype: tuple of int and datetime.timedelta
+
+        """
+        self.cond.acquire()
+        try:
+            times = []
+            for site in set(self.queues) | self.busy:
+                count = len(self.queues.get(site, ())) + (site in self.busy)
+                if site in self.durations:
+                    done, total = self.durations[site]
+                    times.append(count * total / done)
+                else:
+                    times.append(count * config.put_throttle)
+            pending = self.pending
+        finally:
+            self.cond.release()
+        if times:
+            seconds = max(max(times), sum(times) / self.workers)
+        else:
+            seconds = 0
+        return pending, datetime.timedelta(seconds=seconds)
+
+    def metrics(self):
+        """Return a dict describing the progress of the requests.
+
+        Besides the number of requests which were submitted, done, failed
+        or are pending, it contains the pending requests by site, the total
+        time submitters were blocked because too many requests were
+        pending, and the average duration of a request by site.
+
+        """
+        self.cond.acquire()
+        try:
+            return {
+                'submitted': self.submitted,
+                'done': self.done,
+                'failed': self.failed,
+                'pending': self.pending,
+                'pending_by_site': dict(
+                    (site, len(queue) + (site in self.busy))
+                    for site, queue in self.queues.items()),
+                'blocked': self.blocked,
+                'duration_by_site': dict(
+                    (site, total / count)
+                    for site, (count, total) in self.durations.items()),
+            }
+        finally:
+            self.cond.release()
+
+    def join(self, timeout=None):
+        """Wait until all pending requests are done.
+
+        @param timeout: the maximum number of seconds to wait
+        @type timeout: float
+        @return: whether all requests are done
+        @rtype: bool
+
+        """
+        self.cond.acquire()
+        try:
+            if timeout is not None:
+                end = time.time() + timeout
+            while self.pending:
+                if timeout is None:
+                    self.cond.wait()
+                else:
+                    delay = end - time.time()
+                    if delay <= 0:
+                        break
+                    self.cond.wait(delay)
+            return not self.pending
+        finally:
+            self.cond.release()
+
+
+def async_request(request, *args, **kwargs):
+    """Put a request on the queue, to be executed in a background thread.
+
+    If request is a method of a Page, it is scheduled for the page's site,
+    after the other requests for that page.
+
+    """
+    page = getattr(request, '__self__', None)
+    if isinstance(page, Page):
+        page_put_queue.put(request, args, kwargs, site=page.site, key=page)
+    else:
+        page_put_queue.put(request, args, kwargs)
+
+# scheduler of pending requests
+page_put_queue = SaveScheduler(config.max_put_threads, config.max_queue_size)
@@ -429,6 +429,18 @@ def debug(text, layer, decoder=None, newline=True, **kwargs):
     logoutput(text, decoder, newline, DEBUG, layer, **kwargs)
 
 
+def debug_enabled(layer):
+    """Return True if debug records sent to layer are written to the log.
+
+    Use this to avoid building expensive debug messages which are dropped.
+
+    @param layer: The name of the logger, as passed to L{debug}.
+    """
+    if not _handlers_initialized:
+        init_handlers()
+    return logging.getLogger("pywiki." + layer).isEnabledFor(DEBUG)
+
+
 def exception(msg=None, decoder=None, newline=True, tb=False, **kwargs):
     """Output an error traceback to the user via the userinterface.
 
@@ -23,6 +23,7 @@ __docformat__ = 'epytext'
 
 import sys
 import atexit
+import threading
 import time
 
 # Verify that a working httplib2 is present.
@@ -57,7 +58,7 @@ else:
     import urllib.parse as urlparse
     from http import cookiejar as cookielib
 
-from pywikibot import config
+from pywikibot import config, stats
 from pywikibot.exceptions import FatalServerError, Server504Error
 import pywikibot
 from . import threadedhttp
@@ -79,10 +80,16 @@ SSL_CERT_VERIFY_FAILED = ":14090086:"
 USER_AGENT_FORMAT = '{script}/r{version[rev]} Pywikibot/2.0'
 useragent = USER_AGENT_FORMAT.format(script=pywikibot.calledModuleName(),
                                      version=pywikibot.version.getversiondict())
-numthreads = 1
+# number of bytes received on the wire and after decompression
+bytes_received = 0
+bytes_decoded = 0
+_stats_lock = threading.Lock()
+
+numthreads = max(1, config.http_threads)
 threads = []
 
 connection_pool = threadedhttp.ConnectionPool()
+host_limiter = threadedhttp.HostLimiter(config.http_host_limit)
 http_queue = Queue.Queue()
 
 cookie_jar = threadedhttp.LockableCookieJar(
@@ -98,7 +105,8 @@ else:
 # Build up HttpProcessors
 pywikibot.log(u'Starting %(numthreads)i threads...' % locals())
 for i in range(numthreads):
-    proc = threadedhttp.HttpProcessor(http_queue, cookie_jar, connection_pool)
+    proc = threadedhttp.HttpProcessor(http_queue, cookie_jar, connection_pool,
+                                      host_limiter)
     proc.setDaemon(True)
     threads.append(proc)
     proc.start()
@@ -122,26 +130,24 @@ def _flush():
         time.sleep(.1)
 
     pywikibot.log(u"All threads finished.")
+    if bytes_decoded:
+        pywikibot.log(u"Received %i bytes, %i bytes after decompression."
+                      % (bytes_received, bytes_decoded))
 atexit.register(_flush)
 
 # export cookie_jar to global namespace
 pywikibot.cookie_jar = cookie_jar
 
 
-def request(site, uri, ssl=False, *args, **kwargs):
-    """Queue a request to be submitted to Site.
-
-    All parameters not listed below are the same as
-    L{httplib2.Http.request}, but the uri is relative
+def _enqueue(site, uri, ssl=False, callback=None, *args, **kwargs):
+    """Queue a request to be submitted to Site and return it.
 
-    If the site argument is None the uri has to be absolute and is
-    taken. In this case SSL is ignored. Used for requests to non wiki
-    pages.
+    Parameters are the same as for L{request}, plus the optional callback
+    which is called with the L{threadedhttp.HttpRequest} once it has been
+    processed.
 
-    @param site: The Site to connect to
-    @param uri: the URI to retrieve (relative to the site's scriptpath)
-    @param ssl: Use HTTPS connection
-    @return: The received data (a unicode string).
+    @return: The queued request
+    @rtype: L{threadedhttp.HttpRequest}
 
     """
     if site:
@@ -156,14 +162,25 @@ def request(site, uri, ssl=False, *args, **kwargs):
     else:
         baseuri = uri
 
-    # set default user-agent string
+    # set default user-agent string and ask for compressed responses
     kwargs.setdefault("headers", {})
     kwargs["headers"].setdefault("user-agent", useragent)
-    request = threadedhttp.HttpRequest(baseuri, *args, **kwargs)
+    kwargs["headers"].setdefault("accept-encoding", "gzip, deflate")
+    request = threadedhttp.HttpRequest(baseuri, callback=callback,
+                                       *args, **kwargs)
     http_queue.put(request)
-    while not request.lock.acquire(False):
-        time.sleep(0.1)
+    return request
+
+
+def _check_response(site, request):
+    """Raise the error of a processed request or return the received data.
 
+    @param site: The Site the request was submitted to
+    @param request: A processed request
+    @type request: L{threadedhttp.HttpRequest}
+    @return: The received data (a unicode string).
+
+    """
     # TODO: do some error correcting stuff
     if isinstance(request.data, SSLHandshakeError):
         if SSL_CERT_VERIFY_FAILED in str(request.data):
@@ -180,4 +197,65 @@ def request(site, uri, ssl=False, *args, **kwargs):
         pywikibot.warning(u"Http response status %(status)s"
                           % {'status': request.data[0].status})
 
+    if site:
+        # let the site's throttle adapt to the server's response
+        retry_after = request.data[0].get('retry-after', '')
+        # MediaWiki sends maxlag errors with status 200 and Retry-After
+        if retry_after.isdigit():
+            site.throttle.retry_after(int(retry_after))
+        elif request.data[0].status == 200:
+            site.throttle.feedback(request.completed - request.started)
+
+    _count_bytes(request.data[0], request.data[1])
     return request.data[1]
+
+
+def _count_bytes(response, content):
+    """Add the size of a response to the traffic statistics."""
+    global bytes_received, bytes_decoded
+    decoded = len(content)
+    received = int(response.get('-x-wire-length', decoded))
+    _stats_lock.acquire()
+    try:
+        bytes_received += received
+        bytes_decoded += decoded
+    finally:
+        _stats_lock.release()
+
+
+def request(site, uri, ssl=False, *args, **kwargs):
+    """Queue a request to be submitted to Site.
+
+    All parameters not listed below are the same as
+    L{httplib2.Http.request}, but the uri is relative
+
+    If the site argument is None the uri has to be absolute and is
+    taken. In this case SSL is ignored. Used for requests to non wiki
+    pages.
+
+    The calling thread blocks until the response has been received.
+
+    @param site: The Site to connect to
+    @param uri: the URI to retrieve (relative to the site's scriptpath)
+    @param ssl: Use HTTPS connection
+    @return: The received data (a unicode string).
+
+    """
+    request = _enqueue(site, uri, ssl, None, *args, **kwargs)
+    request.wait()
+    if stats.enabled:
+        # keep the request for the statistics of the calling layer
+        stats.local.http_request = request
+        _add_stats(site, request)
+    return _check_response(site, request)
+
+
+def _add_stats(site, request):
+    """Add a processed request to the statistics of module 'http'."""
+    values = {'requests': 1,
+              'queue': request.started - request.queued,
+              'network': request.completed - request.started}
+    if not isinstance(request.data, Exception):
+        values['bytes'] = int(request.data[0].get('-x-wire-length',
+                                                  len(request.data[1])))
+    stats.add(site, 'http', **values)
@@ -3,7 +3,7 @@
 
 This class extends httplib2, adding support for:
     - Cookies, guarded for cross-site redirects
-    - Thread safe ConnectionPool and LockableCookieJar classes
+    - Thread safe ConnectionPool, HostLimiter and LockableCookieJar classes
     - HttpProcessor thread class
     - HttpRequest object
 
@@ -24,6 +24,7 @@ __docformat__ = 'epytext'
 import sys
 import re
 import threading
+import time
 
 if sys.version_info[0] == 2:
     import cookielib
@@ -116,6 +117,40 @@ class ConnectionPool(object):
             self.lock.release()
 
 
+class HostLimiter(object):
+    """A thread-safe limit on simultaneous requests per host."""
+
+    def __init__(self, maxnum=None):
+        """
+        @param maxnum: Maximum number of requests being processed for the
+                       same host at any time. Disable with None.
+
+        """
+        self.semaphores = {}
+        self.lock = threading.Lock()
+        self.maxnum = maxnum
+
+    def __repr__(self):
+        return self.semaphores.__repr__()
+
+    def semaphore(self, host):
+        """Return the semaphore which guards requests to host.
+
+        @param host: The host name (and port) of the request
+        @return: A C{threading.BoundedSemaphore} or None if unlimited
+
+        """
+        if not self.maxnum:
+            return None
+        self.lock.acquire()
+        try:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.maxnum)
+            return self.semaphores[host]
+        finally:
+            self.lock.release()
+
+
 class LockableCookieJar(cookielib.LWPCookieJar):
     """CookieJar with integrated Lock object."""
     def __init__(self, *args, **kwargs):
@@ -155,6 +190,39 @@ class Http(httplib2.Http):
             kwargs.setdefault('proxy_info', config.proxy)
         kwargs.setdefault('timeout', config.socket_timeout)
         httplib2.Http.__init__(self, *args, **kwargs)
+        # number of bytes of response bodies read from the connections
+        self.received = 0
+
+    # whether the bytes read from the connections can be counted
+    counts_received = hasattr(httplib2.Http, '_conn_request')
+
+    def _conn_request(self, conn, *args, **kwargs):
+        """Send a request on conn, counting the bytes of the response body.
+
+        httplib2 decompresses gzip and deflate encoded responses and then
+        drops the length of the content as received, so the body is counted
+        while httplib2 reads it from this connection.
+
+        """
+        getresponse = conn.getresponse
+
+        def counting_getresponse():
+            response = getresponse()
+            read = response.read
+
+            def counting_read(*args):
+                data = read(*args)
+                self.received += len(data)
+                return data
+
+            response.read = counting_read
+            return response
+
+        conn.getresponse = counting_getresponse
+        try:
+            return httplib2.Http._conn_request(self, conn, *args, **kwargs)
+        finally:
+            del conn.getresponse
 
     def request(self, uri, method="GET", body=None, headers=None,
                 max_redirects=None, connection_type=None):
@@ -301,23 +369,59 @@ class HttpRequest(object):
     >>> queue = Queue.Queue()
     >>> request = HttpRequest('https://www.google.com')
     >>> queue.put(request)
-    >>> request.lock.acquire()
+    >>> request.wait()
     >>> print request.data
 
-    C{request.lock.acquire()} will block until the data is available.
+    C{request.wait()} will block until the data is available. Alternatively
+    a callback may be given, which is called with the request as its only
+    argument from the processing thread once the data is available.
 
     """
     def __init__(self, *args, **kwargs):
-        """See C{Http.request} for parameters."""
+        """See C{Http.request} for parameters.
+
+        @param callback: (optional) callable to invoke when the request
+               has been processed
+
+        """
+        self.callback = kwargs.pop('callback', None)
         self.args = args
         self.kwargs = kwargs
         self.data = None
+        uri = args[0] if args else kwargs.get('uri', '')
+        self.host = splithost(splittype(uri)[1])[0]
         self.lock = threading.Semaphore(0)
+        self.finished = threading.Event()
+        # timestamps of queueing, start and end of processing
+        self.queued = time.time()
+        self.started = None
+        self.completed = None
+
+    def done(self):
+        """Mark the request as processed and wake up all waiting threads."""
+        self.finished.set()
+        if self.lock:
+            self.lock.release()
+        if self.callback is not None:
+            try:
+                self.callback(self)
+            except Exception:
+                pywikibot.exception(tb=True)
+
+    def wait(self, timeout=None):
+        """Block until the request has been processed.
+
+        @param timeout: (optional) maximum number of seconds to wait
+        @return: True if the data is available, False on timeout
+
+        """
+        self.finished.wait(timeout)
+        return self.finished.isSet()
 
 
 class HttpProcessor(threading.Thread):
     """Thread object to spawn multiple HTTP connection threads."""
-    def __init__(self, queue, cookiejar, connection_pool):
+    def __init__(self, queue, cookiejar, connection_pool, host_limiter=None):
         """
         @param queue: The C{Queue.Queue} object that contains L{HttpRequest}
                objects.
@@ -325,11 +429,17 @@ class HttpProcessor(threading.Thread):
                requests.
         @param connection_pool: The C{ConnectionPool} object which contains
                connections to share among requests.
+        @param host_limiter: (optional) The C{HostLimiter} object which caps
+               the number of simultaneous requests per host among threads.
 
         """
         threading.Thread.__init__(self)
         self.queue = queue
         self.http = Http(cookiejar=cookiejar, connection_pool=connection_pool)
+        self.host_limiter = host_limiter
+        if not Http.counts_received:
+            pywikibot.log(u"httplib2 %s: bytes received are not counted."
+                          % httplib2.__version__)
 
     def run(self):
         # The Queue item is expected to either an HttpRequest object
@@ -340,11 +450,25 @@ class HttpProcessor(threading.Thread):
             if item is None:
                 pywikibot.debug(u"Shutting down thread.", _logger)
                 return
+            semaphore = None
+            if self.host_limiter is not None:
+                semaphore = self.host_limiter.semaphore(item.host)
+            if semaphore is not None:
+                semaphore.acquire()
+            item.started = time.time()
+            self.http.received = 0
             try:
                 item.data = self.http.request(*item.args, **item.kwargs)
+                if Http.counts_received and \
+                        not isinstance(item.data, Exception):
+                    # the length of the content as received, including
+                    # redirects, to compare it with the decoded size
+                    item.data[0]['-x-wire-length'] = str(self.http.received)
             finally:
-                if item.lock:
-                    item.lock.release()
+                item.completed = time.time()
+                if semaphore is not None:
+                    semaphore.release()
+                item.done()
 
 
 # Metaweb Technologies, Inc. License:
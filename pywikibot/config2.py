@@ -76,6 +76,18 @@ disambiguation_comment = {}
 site_interface = 'APISite'
 # number of days to cache namespaces, api configuration, etc.
 API_config_expiry = 30
+# Storage of the API cache: 'files' keeps one file per entry in the
+# apicache directory, 'sqlite' keeps all entries in the apicache.sqlite
+# database, which can be shared by several bot processes. Existing files
+# can be copied into the database with pywikibot.data.api.migrate_cache().
+API_cache_backend = 'files'
+# Maximum size in megabytes of API cache entries kept in memory.
+# Set to 0 to always read them from the persistent cache.
+API_memory_cache_size = 8
+# Maximum size in megabytes of the persistent API cache. Expired entries are
+# removed in the background; if the directory is still larger, the oldest
+# entries are removed too. Set to None to disable the size limit.
+API_cache_max_size = 256
 
 # Solve captchas in the webbrowser. Setting this to False will result in the
 # exception CaptchaError being thrown if a captcha is encountered.
@@ -434,6 +446,15 @@ maxthrottle = 60
 # 'put_throttle' seconds.
 put_throttle = 10
 
+# Adapt the read and write delays to the server: double them after
+# maxlag errors and Retry-After headers, increase them after responses
+# slower than adaptive_throttle_latency seconds and reduce them again
+# while responses are fast. They stay between the throttle settings above
+# and maxthrottle. Without this, every maxlag error blocks all threads
+# for a fixed time.
+adaptive_throttle = False
+adaptive_throttle_latency = 5.0
+
 # Sometimes you want to know when a delay is inserted. If a delay is larger
 # than 'noisysleep' seconds, it is logged on the screen.
 noisysleep = 3.0
@@ -458,6 +479,40 @@ max_retries = 25
 # Minimum time to wait before resubmitting a failed API request.
 retry_wait = 5
 
+# Per-page property queries of several threads (e.g. page info, page
+# properties or tokens) which are made within this many seconds are sent
+# to the API as a single request. Set to 0 to send every query at once.
+API_batch_window = 0
+
+# Number of continuation responses of API queries (e.g. allpages or
+# categorymembers) which are retrieved in a background thread while the
+# items of the current response are processed. Set to 0 to disable.
+API_query_prefetch = 0
+
+# Number of threads which submit API requests started with
+# Request.submit_async(). Requests are still throttled per site.
+api_async_threads = 4
+
+# Number of page groups which pagegenerators.PreloadingGenerator loads in
+# background threads while the pages of an earlier group are processed.
+# Each of these groups holds up to 'step' pages in memory. Set to 0 to load
+# every group only when it is needed.
+preload_prefetch = 0
+
+# Adapt the number of pages which APISite.preloadpages and
+# pagegenerators.PreloadingGenerator load with one request to the length and
+# duration of the responses, up to the number of titles the API accepts in
+# one request (500 for accounts with the apihighlimits right, otherwise 50).
+# The group size given by the caller is used for the first request.
+preload_adaptive = False
+
+# Number of threads which pagegenerators.PreloadingGenerator uses to preload
+# the pages of different sites concurrently, e.g. the pages collected from
+# interwiki links. Every site still throttles its own requests. With more
+# than 1 thread, the groups of different sites are yielded in the order they
+# have been loaded. The default 1 preloads the sites one after another.
+preload_site_threads = 1
+
 # ############# TABLE CONVERSION BOT SETTINGS ##############
 
 # will split long paragraphs for better reading the source.
@@ -559,6 +614,20 @@ persistent_http = False
 # Default socket timeout. Set to None to disable timeouts.
 socket_timeout = 120  # set a pretty long timeout just in case...
 
+# Number of threads processing HTTP requests. Raising this allows requests
+# issued by different threads (or to different sites) to be in flight at
+# the same time. Every API request still waits for its site's throttle
+# before it is handed to these threads.
+http_threads = 1
+
+# Collect statistics about HTTP and API requests (timings, sizes, retries),
+# see pywikibot.stats. They are written to the log when the bot stops.
+request_stats = False
+
+# Maximum number of HTTP requests processed at the same time for a single
+# host, regardless of http_threads. Set to None or 0 to disable the limit.
+http_host_limit = 2
+
 
 # ############# COSMETIC CHANGES SETTINGS ##############
 # The bot can make some additional changes to each page it edits, e.g. fix
@@ -640,6 +709,12 @@ simulate = False
 # processing. As higher this value this effect will decrease.
 max_queue_size = 64
 
+# Maximum number of threads saving pages in asynchronous mode. The pages of
+# one site are saved one after another, so this is the number of sites
+# which can be saved to at the same time. Callbacks of asynchronous saves
+# may then be called from different threads.
+max_put_threads = 4
+
 # Define the line separator. Pages retrieved via API have "\n" whereas
 # pages fetched from screen (mostly) have "\r\n". Interwiki and category
 # separator settings in family files should use multiplied of this.
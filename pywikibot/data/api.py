@@ -9,10 +9,11 @@ Interface functions to Mediawiki's api.php
 #
 __version__ = '$Id: 7102074a7ad2dfc8231fa4d5edd7ed2a6da611da $'
 
-from collections import MutableMapping
+from collections import MutableMapping, OrderedDict
 from pywikibot.comms import http
 from email.mime.multipart import MIMEMultipart
 from email.mime.nonmultipart import MIMENonMultipart
+import atexit
 import datetime
 import hashlib
 import json
@@ -24,12 +25,15 @@ except ImportError:
     import pickle
 import pprint
 import re
+import threading
 import traceback
 import time
 
 import pywikibot
-from pywikibot import config, login
+from pywikibot import config, login, stats
+from pywikibot.bot import debug_enabled
 from pywikibot.exceptions import Server504Error, FatalServerError, Error
+from pywikibot.tools import Future, ThreadedGenerator, ThreadPool
 
 import sys
 
@@ -44,6 +48,30 @@ _logger = "data.api"
 
 lagpattern = re.compile(r"Waiting for [\d.]+: (?P<lag>\d+) seconds? lagged")
 
+def _unicode(rawdata):
+    """Return the API response rawdata as a unicode string."""
+    if isinstance(rawdata, unicode):
+        return rawdata
+    return rawdata.decode('utf-8', 'replace')
+
+
+# pool of threads running Request.submit_async() calls, created when needed
+_async_pool = None
+_async_pool_lock = threading.Lock()
+
+
+def _get_async_pool():
+    """Return the thread pool for asynchronous requests."""
+    global _async_pool
+    _async_pool_lock.acquire()
+    try:
+        if _async_pool is None:
+            _async_pool = ThreadPool(workers=config.api_async_threads,
+                                     name="APIRequestThread")
+        return _async_pool
+    finally:
+        _async_pool_lock.release()
+
 
 class APIError(pywikibot.Error):
     """The wiki site returned an error message."""
@@ -129,6 +157,9 @@ class Request(MutableMapping):
         self.max_retries = kwargs.pop("max_retries", pywikibot.config.max_retries)
         self.retry_wait = kwargs.pop("retry_wait", pywikibot.config.retry_wait)
         self.params = {}
+        # length and duration of the last response received
+        self.response_size = 0
+        self.response_time = 0.0
         if "action" not in kwargs:
             raise ValueError("'action' specification missing from Request.")
         self.update(**kwargs)
@@ -247,7 +278,13 @@ class Request(MutableMapping):
             simulate = self._simulate(action)
             if simulate:
                 return simulate
+            collect_stats = stats.enabled
+            if collect_stats:
+                started = time.time()
             self.site.throttle(write=self.write)
+            if collect_stats:
+                throttled = time.time() - started
+            sent = time.time()
             uri = self.site.scriptpath() + "/api.php"
             ssl = False
             if self.site.family.name in config.available_ssl_project:
@@ -314,20 +351,33 @@ class Request(MutableMapping):
                 pywikibot.log(u"%s, %s" % (uri, paramstring))
                 self.wait()
                 continue
-            if not isinstance(rawdata, unicode):
+            self.response_size = len(rawdata)
+            self.response_time = time.time() - sent
+            if not isinstance(rawdata, unicode) and \
+                    self.site.encoding().lower() not in ('utf-8', 'utf8'):
                 rawdata = rawdata.decode(self.site.encoding())
-            pywikibot.debug(u"API response received:\n" + rawdata, _logger)
-            if rawdata.startswith(u"unknown_action"):
+            # UTF-8 responses are parsed as received; decoding them first
+            # would create another copy of the possibly huge response.
+            if debug_enabled(_logger):
+                pywikibot.debug(u"API response received:\n"
+                                + _unicode(rawdata), _logger)
+            if rawdata[:14] in (u"unknown_action", b"unknown_action"):
+                rawdata = _unicode(rawdata)
                 raise APIError(rawdata[:14], rawdata[16:])
             try:
+                if collect_stats:
+                    started = time.time()
                 result = json.loads(rawdata)
+                if collect_stats:
+                    self._add_stats(throttle=throttled,
+                                    decode=time.time() - started)
             except ValueError:
                 # if the result isn't valid JSON, there must be a server
                 # problem.  Wait a few seconds and try again
                 pywikibot.warning(
                     "Non-JSON response received from server %s; the server may be down."
                     % self.site)
-                pywikibot.debug(rawdata, _logger)
+                pywikibot.debug(_unicode(rawdata), _logger)
                 # there might also be an overflow, so try a smaller limit
                 for param in self.params:
                     if param.endswith("limit"):
@@ -394,7 +444,12 @@ class Request(MutableMapping):
                 if lag:
                     pywikibot.log(
                         u"Pausing due to database lag: " + info)
+                    started = time.time()
                     self.site.throttle.lag(int(lag.group("lag")))
+                    if collect_stats:
+                        stats.add(self.site, self._module_name(),
+                                  maxlag_waits=1,
+                                  maxlag=time.time() - started)
                     continue
             if code.startswith(u'internal_api_error_'):
                 self.wait()
@@ -419,8 +474,57 @@ class Request(MutableMapping):
             except TypeError:
                 raise RuntimeError(result)
 
+    def submit_async(self):
+        """Submit a query in a background thread.
+
+        The request is processed by L{submit} in one of
+        config.api_async_threads threads, so the usual throttling, maxlag,
+        retry and login handling applies. Several requests can be in
+        flight at the same time:
+
+        >>> tokens = Request(site=mysite, action="tokens").submit_async()
+        >>> info = Request(site=mysite, action="query",
+        ...                meta="siteinfo").submit_async()
+        >>> data = info.result()
+
+        @return: future holding the data retrieved from api.php (a dict);
+            its result() method raises any error raised by L{submit}
+        @rtype: L{pywikibot.tools.Future}
+
+        """
+        return _get_async_pool().submit(self.submit)
+
+    def _module_name(self):
+        """Return the name of the API module used, for the statistics."""
+        action = self.params.get("action", "")
+        if isinstance(action, list):
+            action = "|".join(action)
+        if action != "query":
+            return action
+        modules = []
+        for modtype in ("generator", "list", "prop", "meta"):
+            if modtype in self.params:
+                module = self.params[modtype]
+                if isinstance(module, list):
+                    module = "|".join(module)
+                modules.append(module)
+        return "query+" + "|".join(modules)
+
+    def _add_stats(self, **values):
+        """Add a request with its phase timings to the statistics."""
+        request = getattr(stats.local, 'http_request', None)
+        if request is not None:
+            values['queue'] = request.started - request.queued
+            values['network'] = request.completed - request.started
+            if not isinstance(request.data, Exception):
+                values['bytes'] = int(request.data[0].get(
+                    '-x-wire-length', len(request.data[1])))
+        stats.add(self.site, self._module_name(), requests=1, **values)
+
     def wait(self):
         """Determine how long to wait after a failed request."""
+        if stats.enabled:
+            stats.add(self.site, self._module_name(), retries=1)
         self.max_retries -= 1
         if self.max_retries < 0:
             raise TimeoutError("Maximum retries attempted without success.")
@@ -431,7 +535,279 @@ class Request(MutableMapping):
         self.retry_wait = min(120, self.retry_wait * 2)
 
 
+class MemoryCache(object):
+
+    """Thread-safe in-memory LRU store for pickled cache entries.
+
+    Entries are kept as pickled byte strings, so every lookup returns a
+    fresh copy of the data and the size of the cache is known exactly.
+    When the total size exceeds maxsize bytes, the least recently used
+    entries are evicted.
+
+    """
+
+    def __init__(self, maxsize):
+        """
+        @param maxsize: the maximum total size of all entries in bytes
+        @type maxsize: int
+
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the entry stored for key, or None."""
+        self.lock.acquire()
+        try:
+            blob = self.entries.pop(key, None)
+            if blob is None:
+                self.misses += 1
+                return None
+            # re-insert as the most recently used entry
+            self.entries[key] = blob
+            self.hits += 1
+            return blob
+        finally:
+            self.lock.release()
+
+    def put(self, key, blob):
+        """Store blob for key, evicting old entries as needed."""
+        self.lock.acquire()
+        try:
+            self._remove(key)
+            if len(blob) > self.maxsize:
+                return
+            self.entries[key] = blob
+            self.size += len(blob)
+            while self.size > self.maxsize:
+                oldkey = next(iter(self.entries))
+                self._remove(oldkey)
+                self.evictions += 1
+        finally:
+            self.lock.release()
+
+    def discard(self, key):
+        """Remove the entry stored for key, if any."""
+        self.lock.acquire()
+        try:
+            self._remove(key)
+        finally:
+            self.lock.release()
+
+    def _remove(self, key):
+        blob = self.entries.pop(key, None)
+        if blob is not None:
+            self.size -= len(blob)
+
+    def stats(self):
+        """Return a dict with the hit, miss and eviction counts."""
+        return {'entries': len(self.entries), 'size': self.size,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+def _timestamp(dt):
+    """Convert a local datetime to seconds since the epoch."""
+    return time.mktime(dt.timetuple()) + dt.microsecond / 1000000.0
+
+
+class FileCacheStorage(object):
+
+    """Storage of API cache entries as one pickle file per entry."""
+
+    def __init__(self, path):
+        """
+        @param path: the directory holding the cache files
+        @type path: basestring
+
+        """
+        self.path = path
+
+    def get(self, key):
+        """Return the pickled entry stored for key, or None."""
+        try:
+            with open(os.path.join(self.path, key), 'rb') as f:
+                return f.read()
+        except IOError:
+            # file not found
+            return None
+
+    def put(self, key, blob, cachetime, expiry):
+        """Store the pickled entry blob for key."""
+        with open(os.path.join(self.path, key), 'wb') as f:
+            f.write(blob)
+
+    def prune(self, maxsize=None):
+        """Remove expired entries, then the oldest ones above maxsize bytes.
+
+        Entries written without their expiry are considered expired after
+        config.API_config_expiry days.
+
+        @return: the number of removed entries
+
+        """
+        default_expiry = datetime.timedelta(config.API_config_expiry)
+        now = datetime.datetime.now()
+        removed = 0
+        files = []
+        total = 0
+        for filename in os.listdir(self.path):
+            path = os.path.join(self.path, filename)
+            try:
+                with open(path, 'rb') as f:
+                    entry = pickle.load(f)
+                expiry = entry[3] if len(entry) > 3 else default_expiry
+                if entry[2] + expiry < now:
+                    os.remove(path)
+                    removed += 1
+                    continue
+                stat = os.stat(path)
+            except Exception as e:
+                pywikibot.debug(u"Could not prune cache file %s: %r"
+                                % (filename, e), _logger)
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if maxsize is None:
+            return removed
+        files.sort()
+        for mtime, size, path in files:
+            if total <= maxsize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def keys(self):
+        """Return the keys of all stored entries."""
+        return os.listdir(self.path)
+
+
+class SQLiteCacheStorage(object):
+
+    """Storage of API cache entries in a single SQLite database.
+
+    The expiry time of each entry is indexed, so that expired entries are
+    removed by a single query. SQLite locks the database file, so several
+    bot processes can share it; every thread uses its own connection.
+
+    """
+
+    def __init__(self, filename):
+        """
+        @param filename: the path of the database file
+        @type filename: basestring
+
+        """
+        self.filename = filename
+        self.local = threading.local()
+        conn = self._connection()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                         "size INTEGER NOT NULL, written REAL NOT NULL, "
+                         "expires REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_expires "
+                         "ON entries (expires)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_written "
+                         "ON entries (written)")
+
+    def _connection(self):
+        """Return the database connection of the current thread."""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self.filename, timeout=60)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.DatabaseError:
+                # not supported by this SQLite version; use the default
+                pass
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Return the pickled entry stored for key, or None."""
+        row = self._connection().execute(
+            "SELECT value FROM entries WHERE key = ?", (key, )).fetchone()
+        if row is None:
+            return None
+        return bytes(row[0])
+
+    def put(self, key, blob, cachetime, expiry):
+        """Store the pickled entry blob for key."""
+        import sqlite3
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO entries "
+                         "(key, value, size, written, expires) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (key, sqlite3.Binary(blob), len(blob),
+                          _timestamp(cachetime),
+                          _timestamp(cachetime + expiry)))
+
+    def prune(self, maxsize=None):
+        """Remove expired entries, then the oldest ones above maxsize bytes.
+
+        @return: the number of removed entries
+
+        """
+        conn = self._connection()
+        with conn:
+            removed = conn.execute("DELETE FROM entries WHERE expires < ?",
+                                   (time.time(), )).rowcount
+        if maxsize is None:
+            return removed
+        with conn:
+            total = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= maxsize:
+                return removed
+            cursor = conn.execute("SELECT key, size FROM entries "
+                                  "ORDER BY written")
+            oldest = []
+            for key, size in cursor:
+                if total <= maxsize:
+                    break
+                oldest.append((key, ))
+                total -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", oldest)
+        return removed + len(oldest)
+
+    def keys(self):
+        """Return the keys of all stored entries."""
+        return [row[0] for row in
+                self._connection().execute("SELECT key FROM entries")]
+
+
 class CachedRequest(Request):
+    """A Request whose result is cached for the given expiry time.
+
+    Depending on config.API_cache_backend, entries are stored as files in
+    the apicache directory or in the apicache.sqlite database. Recently used
+    entries are also kept in memory, up to config.API_memory_cache_size
+    megabytes. The first CachedRequest submitted starts a background thread
+    which prunes expired entries and limits the persistent cache to
+    config.API_cache_max_size megabytes.
+
+    """
+
+    memory_cache = MemoryCache(config.API_memory_cache_size * 1024 * 1024)
+    disk_hits = 0
+    pruned = 0
+    _storage = None
+    _pruner = None
+    _lock = threading.Lock()
+
     def __init__(self, expiry, *args, **kwargs):
         """ expiry should be either a number of days or a datetime.timedelta object """
         super(CachedRequest, self).__init__(*args, **kwargs)
@@ -471,6 +847,62 @@ class CachedRequest(Request):
             pass
         return dir
 
+    @classmethod
+    def _get_storage(cls):
+        """Return the persistent cache storage selected in the config."""
+        cls._lock.acquire()
+        try:
+            if cls._storage is None:
+                if config.API_cache_backend == 'sqlite':
+                    cls._storage = SQLiteCacheStorage(
+                        config.datafilepath('apicache.sqlite'))
+                elif config.API_cache_backend == 'files':
+                    cls._storage = FileCacheStorage(cls._get_cache_dir())
+                else:
+                    raise ValueError("Unknown API cache backend '%s'."
+                                     % config.API_cache_backend)
+            return cls._storage
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def cache_stats(cls):
+        """Return a dict with the cache hit, miss and eviction counts.
+
+        'hits', 'misses' and 'evictions' refer to the in-memory cache;
+        'disk_hits' counts memory misses found in the persistent cache
+        and 'pruned' the number of entries removed from it.
+
+        """
+        stats = cls.memory_cache.stats()
+        stats['disk_hits'] = cls.disk_hits
+        stats['pruned'] = cls.pruned
+        return stats
+
+    @classmethod
+    def _start_pruner(cls):
+        """Start the thread pruning the persistent cache, once."""
+        cls._lock.acquire()
+        try:
+            if cls._pruner is None:
+                cls._pruner = threading.Thread(target=cls._prune_cache,
+                                               name="APICachePruner")
+                cls._pruner.setDaemon(True)
+                cls._pruner.start()
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def _prune_cache(cls):
+        """Prune the persistent cache storage."""
+        maxsize = config.API_cache_max_size
+        if maxsize is not None:
+            maxsize *= 1024 * 1024
+        try:
+            cls.pruned += cls._get_storage().prune(maxsize)
+        except Exception as e:
+            pywikibot.debug(u"Could not prune API cache: %r" % e, _logger)
+
     def _uniquedescriptionstr(self):
         """ Unique description for the cache entry.
 
@@ -500,37 +932,49 @@ class CachedRequest(Request):
             self._uniquedescriptionstr().encode('utf-8')
         ).hexdigest()
 
-    def _cachefile_path(self):
-        return os.path.join(CachedRequest._get_cache_dir(),
-                            self._create_file_name())
+    def _cachefile_path(self, filename=None):
+        if filename is None:
+            filename = self._create_file_name()
+        return os.path.join(CachedRequest._get_cache_dir(), filename)
 
     def _expired(self, dt):
         return dt + self.expiry < datetime.datetime.now()
 
     def _load_cache(self):
         """ Return whether the cache can be used """
+        filename = self._create_file_name()
         try:
-            with open(self._cachefile_path(), 'rb') as f:
-                uniquedescr, self._data, self._cachetime = pickle.load(f)
+            blob = CachedRequest.memory_cache.get(filename)
+            if blob is None:
+                blob = CachedRequest._get_storage().get(filename)
+                if blob is None:
+                    return False
+                CachedRequest.disk_hits += 1
+                CachedRequest.memory_cache.put(filename, blob)
+            entry = pickle.loads(blob)
+            uniquedescr, self._data, self._cachetime = entry[:3]
             assert(uniquedescr == str(self._uniquedescriptionstr()))
             if self._expired(self._cachetime):
+                CachedRequest.memory_cache.discard(filename)
                 self._data = None
                 return False
             return True
-        except IOError as e:
-            # file not found
-            return False
         except Exception as e:
             pywikibot.output("Could not load cache: %r" % e)
             return False
 
     def _write_cache(self, data):
-        """ writes data to self._cachefile_path() """
-        data = [self._uniquedescriptionstr(), data, datetime.datetime.now()]
-        with open(self._cachefile_path(), 'wb') as f:
-            pickle.dump(data, f)
+        """ writes data to the cache storage """
+        filename = self._create_file_name()
+        cachetime = datetime.datetime.now()
+        data = [self._uniquedescriptionstr(), data, cachetime, self.expiry]
+        blob = pickle.dumps(data)
+        CachedRequest._get_storage().put(filename, blob, cachetime,
+                                         self.expiry)
+        CachedRequest.memory_cache.put(filename, blob)
 
     def submit(self):
+        CachedRequest._start_pruner()
         cached_available = self._load_cache()
         if not cached_available:
             self._data = super(CachedRequest, self).submit()
@@ -538,6 +982,52 @@ class CachedRequest(Request):
         return self._data
 
 
+def migrate_cache(remove=False):
+    """Copy the entries of the apicache directory into the SQLite cache.
+
+    Entries which cannot be read or are already expired are skipped.
+
+    @param remove: remove each file from the apicache directory once it
+        has been copied
+    @type remove: bool
+    @return: the number of copied entries
+
+    """
+    source = FileCacheStorage(CachedRequest._get_cache_dir())
+    target = SQLiteCacheStorage(config.datafilepath('apicache.sqlite'))
+    default_expiry = datetime.timedelta(config.API_config_expiry)
+    now = datetime.datetime.now()
+    count = 0
+    for key in source.keys():
+        blob = source.get(key)
+        try:
+            entry = pickle.loads(blob)
+            cachetime = entry[2]
+            expiry = entry[3] if len(entry) > 3 else default_expiry
+        except Exception as e:
+            pywikibot.warning(u"Could not migrate cache file %s: %r"
+                              % (key, e))
+            continue
+        if cachetime + expiry >= now:
+            target.put(key, blob, cachetime, expiry)
+            count += 1
+        if remove:
+            os.remove(os.path.join(source.path, key))
+    pywikibot.output(u"Migrated %i API cache entries to %s."
+                     % (count, target.filename))
+    return count
+
+
+def _log_cache_stats():
+    """Log the CachedRequest statistics, if the cache has been used."""
+    stats = CachedRequest.cache_stats()
+    if stats['hits'] or stats['misses'] or stats['pruned']:
+        pywikibot.log(u"API cache: %(hits)i memory hits, %(disk_hits)i disk "
+                      u"hits, %(misses)i memory misses, %(evictions)i "
+                      u"evictions, %(pruned)i files pruned" % stats)
+atexit.register(_log_cache_stats)
+
+
 class QueryGenerator(object):
     """Base class for iterators that handle responses to API action=query.
 
@@ -589,6 +1079,10 @@ class QueryGenerator(object):
             self.prefix = "g" + self.prefix
         self.limit = None
         self.query_limit = self.api_limit
+        self.prefetch = config.API_query_prefetch
+        # length and duration of the response held in self.data
+        self.response_size = 0
+        self.response_time = 0.0
         if "generator" in kwargs:
             self.resultkey = "pages"        # name of the "query" subelement key
         else:                               # to look for when iterating
@@ -708,110 +1202,202 @@ class QueryGenerator(object):
                     self.request[self.prefix + "namespace"] = namespaces
                     return
 
+    def set_prefetch(self, depth):
+        """Set the number of continuation responses to retrieve in advance.
+
+        If depth is positive and no maximum number of items is set, the
+        request for the next batch of items is sent in a background thread
+        as soon as the current response has been received, while the
+        current items are being processed. Up to depth responses are kept
+        waiting. Every request is still subject to the site's throttle.
+
+        If not called, the default is config.API_query_prefetch.
+
+        """
+        self.prefetch = int(depth)
+
+    def _update_request_limit(self, count):
+        """Set the limit parameter of the request for the next batch.
+
+        @param count: the number of items retrieved so far
+
+        """
+        if self.query_limit is not None:
+            if self.limit is None:
+                new_limit = self.query_limit
+            elif self.limit > 0:
+                new_limit = min(self.query_limit, self.limit - count)
+            else:
+                new_limit = None
+
+            if new_limit and \
+                    "rvprop" in self.request \
+                    and "content" in self.request["rvprop"]:
+                # queries that retrieve page content have lower limits
+                # Note: although API allows up to 500 pages for content
+                #   queries, these sometimes result in server-side errors
+                #   so use 250 as a safer limit
+                new_limit = min(new_limit, self.api_limit // 10, 250)
+            if new_limit is not None:
+                self.request[self.prefix + "limit"] = str(new_limit)
+
+    def _resultdata(self):
+        """Return the list of items in self.data, or None to stop iterating.
+
+        This also sets self.normalized from the response.
+
+        """
+        if not self.data or not isinstance(self.data, dict):
+            pywikibot.debug(
+                u"%s: stopped iteration because no dict retrieved from api."
+                % self.__class__.__name__,
+                _logger)
+            return None
+        if "query" not in self.data:
+            pywikibot.debug(
+                u"%s: stopped iteration because 'query' not found in api response."
+                % (self.__class__.__name__, self.resultkey),
+                _logger)
+            pywikibot.debug(unicode(self.data), _logger)
+            return None
+        resultdata = []
+        if self.resultkey in self.data["query"]:
+            resultdata = self.data["query"][self.resultkey]
+            if isinstance(resultdata, dict):
+                pywikibot.debug(u"%s received %s; limit=%s"
+                                % (self.__class__.__name__,
+                                   list(resultdata.keys()),
+                                   self.limit),
+                                _logger)
+                if "results" in resultdata:
+                    resultdata = resultdata["results"]
+                elif "pageids" in self.data["query"]:
+                    # this ensures that page data will be iterated
+                    # in the same order as received from server
+                    resultdata = [resultdata[k]
+                                  for k in self.data["query"]["pageids"]]
+                else:
+                    resultdata = [resultdata[k]
+                                  for k in sorted(resultdata.keys())]
+            else:
+                pywikibot.debug(u"%s received %s; limit=%s"
+                                % (self.__class__.__name__,
+                                   resultdata,
+                                   self.limit),
+                                _logger)
+            if "normalized" in self.data["query"]:
+                self.normalized = dict((item['to'], item['from'])
+                                       for item in
+                                       self.data["query"]["normalized"])
+            else:
+                self.normalized = {}
+        return resultdata
+
+    def _continue(self, data):
+        """Set the query-continue values of data on the request.
+
+        @return: False if there are no more items to retrieve
+
+        """
+        if "query-continue" not in data:
+            return False
+        if all(key not in data["query-continue"] for key in self.continuekey):
+            pywikibot.log(
+                u"Missing '%s' key(s) in ['query-continue'] value."
+                % self.continuekey)
+            return False
+        query_continue_pairs = data["query-continue"].values()
+        for query_continue_pair in query_continue_pairs:
+            for key, value in query_continue_pair.items():
+                # query-continue can return ints
+                if isinstance(value, int):
+                    value = str(value)
+                self.request[key] = value
+        return True
+
+    def _continued_responses(self, stopped):
+        """Submit the request and its continuations, yielding each response.
+
+        Each response is yielded as a (data, size, time) tuple. The size
+        and time are read from the request right after it was submitted,
+        before the next continuation overwrites them. Exceptions are
+        yielded instead of being raised, so that they can be passed from a
+        background thread to the consuming thread.
+
+        @param stopped: no further request is submitted once it is set
+        @type stopped: threading.Event
+
+        """
+        try:
+            self._update_request_limit(0)
+            while not stopped.isSet():
+                data = self.request.submit()
+                yield (data, self.request.response_size,
+                       self.request.response_time)
+                if not isinstance(data, dict) or not self._continue(data):
+                    return
+        except Exception as e:
+            yield e
+
     def __iter__(self):
         """Submit request and iterate the response based on self.resultkey
 
         Continues response as needed until limit (if any) is reached.
 
         """
+        if self.prefetch > 0 and not hasattr(self, "data") \
+                and not self.limit > 0:
+            responses = ThreadedGenerator(target=self._continued_responses,
+                                          name="QueryPrefetchThread",
+                                          qsize=self.prefetch)
+            responses.args = (responses.finished,)
+            responses.setDaemon(True)
+            try:
+                for response in responses:
+                    if isinstance(response, Exception):
+                        raise response
+                    (self.data, self.response_size,
+                     self.response_time) = response
+                    resultdata = self._resultdata()
+                    if resultdata is None:
+                        return
+                    for item in resultdata:
+                        yield self.result(item)
+            finally:
+                responses.stop()
+            return
+
         count = 0
         while True:
-            if self.query_limit is not None:
-                if self.limit is None:
-                    new_limit = self.query_limit
-                elif self.limit > 0:
-                    new_limit = min(self.query_limit, self.limit - count)
-                else:
-                    new_limit = None
-
-                if new_limit and \
-                        "rvprop" in self.request \
-                        and "content" in self.request["rvprop"]:
-                    # queries that retrieve page content have lower limits
-                    # Note: although API allows up to 500 pages for content
-                    #   queries, these sometimes result in server-side errors
-                    #   so use 250 as a safer limit
-                    new_limit = min(new_limit, self.api_limit // 10, 250)
-                if new_limit is not None:
-                    self.request[self.prefix + "limit"] = str(new_limit)
+            self._update_request_limit(count)
             if not hasattr(self, "data"):
                 self.data = self.request.submit()
-            if not self.data or not isinstance(self.data, dict):
-                pywikibot.debug(
-                    u"%s: stopped iteration because no dict retrieved from api."
-                    % self.__class__.__name__,
-                    _logger)
+                self.response_size = self.request.response_size
+                self.response_time = self.request.response_time
+            resultdata = self._resultdata()
+            if resultdata is None:
                 return
-            if "query" not in self.data:
-                pywikibot.debug(
-                    u"%s: stopped iteration because 'query' not found in api response."
-                    % (self.__class__.__name__, self.resultkey),
-                    _logger)
-                pywikibot.debug(unicode(self.data), _logger)
-                return
-            if self.resultkey in self.data["query"]:
-                resultdata = self.data["query"][self.resultkey]
-                if isinstance(resultdata, dict):
-                    pywikibot.debug(u"%s received %s; limit=%s"
-                                    % (self.__class__.__name__,
-                                       list(resultdata.keys()),
-                                       self.limit),
-                                    _logger)
-                    if "results" in resultdata:
-                        resultdata = resultdata["results"]
-                    elif "pageids" in self.data["query"]:
-                        # this ensures that page data will be iterated
-                        # in the same order as received from server
-                        resultdata = [resultdata[k]
-                                      for k in self.data["query"]["pageids"]]
-                    else:
-                        resultdata = [resultdata[k]
-                                      for k in sorted(resultdata.keys())]
+            for item in resultdata:
+                yield self.result(item)
+                if isinstance(item, dict) and set(self.continuekey) & set(item.keys()):
+                    # if we need to count elements contained in items in
+                    # self.data["query"]["pages"], we want to count
+                    # item[self.continuekey] (e.g. 'revisions') and not
+                    # self.resultkey (i.e. 'pages')
+                    for key in set(self.continuekey) & set(item.keys()):
+                        count += len(item[key])
+                # otherwise we proceed as usual
                 else:
-                    pywikibot.debug(u"%s received %s; limit=%s"
-                                    % (self.__class__.__name__,
-                                       resultdata,
-                                       self.limit),
-                                    _logger)
-                if "normalized" in self.data["query"]:
-                    self.normalized = dict((item['to'], item['from'])
-                                           for item in
-                                           self.data["query"]["normalized"])
-                else:
-                    self.normalized = {}
-                for item in resultdata:
-                    yield self.result(item)
-                    if isinstance(item, dict) and set(self.continuekey) & set(item.keys()):
-                        # if we need to count elements contained in items in
-                        # self.data["query"]["pages"], we want to count
-                        # item[self.continuekey] (e.g. 'revisions') and not
-                        # self.resultkey (i.e. 'pages')
-                        for key in set(self.continuekey) & set(item.keys()):
-                            count += len(item[key])
-                    # otherwise we proceed as usual
-                    else:
-                        count += 1
-                    # note: self.limit could be -1
-                    if self.limit > 0 and count >= self.limit:
-                        return
+                    count += 1
+                # note: self.limit could be -1
+                if self.limit > 0 and count >= self.limit:
+                    return
             if self.module == "random" and self.limit:
                 # "random" module does not return "query-continue"
                 # now we loop for a new random query
                 continue
-            if "query-continue" not in self.data:
-                return
-            if all(key not in self.data["query-continue"] for key in self.continuekey):
-                pywikibot.log(
-                    u"Missing '%s' key(s) in ['query-continue'] value."
-                    % self.continuekey)
+            if not self._continue(self.data):
                 return
-            query_continue_pairs = self.data["query-continue"].values()
-            for query_continue_pair in query_continue_pairs:
-                for key, value in query_continue_pair.items():
-                    # query-continue can return ints
-                    if isinstance(value, int):
-                        value = str(value)
-                    self.request[key] = value
 
             del self.data  # a new request with query-continue is needed
 
@@ -913,6 +1499,168 @@ class PropertyGenerator(QueryGenerator):
         self.resultkey = "pages"
 
 
+class BatchSizer(object):
+    """Adapt the number of items requested at once to the responses.
+
+    After a response which was larger than target_size bytes or took longer
+    than target_time seconds the batch size is halved. After a full batch
+    with a smaller response the size is doubled at most, to the number of
+    items which is expected to fill target_size, and never beyond maximum.
+
+    """
+
+    target_size = 4 * 1024 * 1024
+    target_time = 10.0
+
+    def __init__(self, size, maximum):
+        """
+        @param size: the initial batch size
+        @type size: int
+        @param maximum: the largest batch size allowed by the API; if None,
+            the batch size never exceeds the initial size
+        @type maximum: int or None
+
+        """
+        if maximum is None:
+            maximum = size
+        self.maximum = max(1, maximum)
+        self.size = max(1, min(size, self.maximum))
+        self.lock = threading.Lock()
+
+    def feedback(self, count, size, latency):
+        """Adjust the batch size after the response to a batch.
+
+        @param count: the number of items in the batch
+        @type count: int
+        @param size: the length of the response(s)
+        @type size: int
+        @param latency: the time taken by the response(s) in seconds
+        @type latency: float
+
+        """
+        self.lock.acquire()
+        try:
+            if size > self.target_size or latency > self.target_time:
+                self.size = max(1, min(self.size, count) // 2)
+            elif count >= self.size:
+                if size:
+                    expected = self.target_size * count // size
+                else:
+                    expected = self.maximum
+                self.size = max(1, min(self.maximum, 2 * self.size, expected))
+            pywikibot.debug(u"%s: batch size %d after %d items, %d bytes, "
+                            u"%.1f s" % (self.__class__.__name__, self.size,
+                                         count, size, latency),
+                            _logger)
+        finally:
+            self.lock.release()
+
+
+class PropertyBatcher(object):
+    """Combine per-page property queries into multi-title requests.
+
+    Each call to submit() asks for the properties of a single page. Calls
+    with the same property and parameters that arrive within a time window
+    (config.API_batch_window seconds) are sent to the API as a single
+    request with titles=A|B|C..., and every caller receives the data of
+    its own page. A batch is sent as soon as it contains groupsize titles.
+
+    With a window of 0 every call is sent immediately on its own; batching
+    only pays off when several threads query the same site.
+
+    """
+    def __init__(self, site, window=None, groupsize=50):
+        """
+        @param site: the Site to query
+        @param window: seconds to wait for more titles before sending a
+            request; defaults to config.API_batch_window
+        @type window: float
+        @param groupsize: maximum number of titles per request
+        @type groupsize: int
+
+        """
+        self.site = site
+        if window is None:
+            window = config.API_batch_window
+        self.window = window
+        self.groupsize = groupsize
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def submit(self, title, prop, **params):
+        """Queue a query for the properties of a single page.
+
+        @param title: the page title
+        @param prop: the "property=" type from api.php
+        @type prop: str
+        @return: future holding the "page" element of the query response
+            for title, or None if the response contains no such element
+        @rtype: L{pywikibot.tools.Future}
+
+        """
+        future = Future()
+        if not self.window:
+            self._send(prop, params, [(title, future)])
+            return future
+        key = (prop, repr(sorted(params.items())))
+        batch = None
+        self.lock.acquire()
+        try:
+            pending = self.pending.setdefault(key, [])
+            pending.append((title, future))
+            if len(pending) >= self.groupsize:
+                batch = self.pending.pop(key)
+            elif len(pending) == 1:
+                timer = threading.Timer(self.window, self._flush,
+                                        (key, prop, params))
+                timer.setDaemon(True)
+                timer.start()
+        finally:
+            self.lock.release()
+        if batch:
+            self._send(prop, params, batch)
+        return future
+
+    def _flush(self, key, prop, params):
+        """Send the pending batch for key, if any."""
+        self.lock.acquire()
+        try:
+            batch = self.pending.pop(key, None)
+        finally:
+            self.lock.release()
+        if batch:
+            self._send(prop, params, batch)
+
+    def _send(self, prop, params, batch):
+        """Query the API for a batch and hand out the results."""
+        titles = []
+        for title, future in batch:
+            if title not in titles:
+                titles.append(title)
+        results = {}
+        normalized = {}
+        try:
+            query = PropertyGenerator(prop, site=self.site,
+                                      titles=u"|".join(titles), **params)
+            for pagedata in query:
+                if 'title' in pagedata:
+                    results[pagedata['title']] = pagedata
+                normalized.update((item_from, item_to) for item_to, item_from
+                                  in query.normalized.items())
+        except Exception as e:
+            for title, future in batch:
+                future.set_exception(e)
+            return
+        for title, future in batch:
+            pagedata = results.get(normalized.get(title, title))
+            if pagedata is None:
+                for result_title in results:
+                    if self.site.sametitle(result_title, title):
+                        pagedata = results[result_title]
+                        break
+            future.set_result(pagedata)
+
+
 class ListGenerator(QueryGenerator):
     """Iterator for queries of type action=query&list=...
 
@@ -1014,6 +1762,9 @@ def update_page(page, pagedict):
     @type pagedict: dict
 
     """
+    collect_stats = stats.enabled
+    if collect_stats:
+        started = time.time()
     if "pageid" in pagedict:
         page._pageid = int(pagedict['pageid'])
     elif "missing" in pagedict:
@@ -1093,6 +1844,10 @@ def update_page(page, pagedict):
     if "flowinfo" in pagedict:
         page._flowinfo = pagedict['flowinfo']['flow']
 
+    if collect_stats:
+        stats.add(page.site, 'update_page', calls=1,
+                  seconds=time.time() - started)
+
 
 if __name__ == "__main__":
     from pywikibot import Site, logging
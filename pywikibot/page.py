@@ -404,12 +404,29 @@ class Page(pywikibot.UnicodeMixin, ComparableMixin):
         @param value: basestring
         """
         self._text = None if value is None else unicode(value)
+        self._parsed_text = None
 
     @text.deleter
     def text(self):
         """Delete the current (edited) wikitext."""
         if hasattr(self, "_text"):
             del self._text
+        self._parsed_text = None
+
+    @property
+    def parsed_text(self):
+        """Return the parsed markup of the current wikitext.
+
+        It is parsed when first needed, and again after the text has changed.
+
+        @return: L{pywikibot.textlib.ParsedText}
+        """
+        text = self.text
+        parsed = getattr(self, '_parsed_text', None)
+        if parsed is None or parsed.text is not text:
+            parsed = pywikibot.textlib.ParsedText(text, self.site)
+            self._parsed_text = parsed
+        return parsed
 
     def preloadText(self):
         """The text returned by EditFormPreloadText.
@@ -892,7 +909,7 @@ class Page(pywikibot.UnicodeMixin, ComparableMixin):
 
     @deprecate_arg('sysop', None)
     def save(self, comment=None, watch=None, minor=True, botflag=None,
-             force=False, async=False, callback=None, **kwargs):
+             force=False, async=False, callback=None, priority=0, **kwargs):
         """Save the current contents of page's text to the wiki.
 
         @param comment: The edit summary for the modification (optional, but
@@ -916,6 +933,9 @@ class Page(pywikibot.UnicodeMixin, ComparableMixin):
             if the page was saved successfully. The callback is intended for
             use by bots that need to keep track of which saves were
             successful.
+        @param priority: if async, pages with a higher priority are saved
+            first; earlier saves of the same page are never overtaken
+        @type priority: int
 
         """
         if not comment:
@@ -933,9 +953,11 @@ class Page(pywikibot.UnicodeMixin, ComparableMixin):
         if botflag is None:
             botflag = ("bot" in self.site.userinfo["rights"])
         if async:
-            pywikibot.async_request(self._save, comment=comment, minor=minor,
-                                    watchval=watchval, botflag=botflag,
-                                    async=async, callback=callback, **kwargs)
+            kwargs.update(comment=comment, minor=minor, watchval=watchval,
+                          botflag=botflag, async=async, callback=callback)
+            pywikibot.page_put_queue.put(self._save, kwargs=kwargs,
+                                         site=self.site, key=self,
+                                         priority=priority)
         else:
             self._save(comment=comment, minor=minor, watchval=watchval,
                        botflag=botflag, async=async, callback=callback,
@@ -1092,7 +1114,7 @@ class Page(pywikibot.UnicodeMixin, ComparableMixin):
         if expand:
             text = self.expand_text()
         else:
-            text = self.text
+            text = self
         for linkmatch in pywikibot.link_regex.finditer(
                 pywikibot.removeDisabledParts(text)):
             linktitle = linkmatch.group("title")
@@ -1229,7 +1251,7 @@ class Page(pywikibot.UnicodeMixin, ComparableMixin):
         # WARNING: may not return all templates used in particularly
         # intricate cases such as template substitution
         titles = list(t.title() for t in self.templates())
-        templates = pywikibot.extract_templates_and_params(self.text)
+        templates = pywikibot.extract_templates_and_params(self)
         # backwards-compatibility: convert the dict returned as the second
         # element into a list in the format used by old scripts
         result = []
@@ -1633,8 +1655,7 @@ class Page(pywikibot.UnicodeMixin, ComparableMixin):
         # get list of Category objects the article is in and remove possible
         # duplicates
         cats = []
-        for cat in pywikibot.textlib.getCategoryLinks(self.text,
-                                                      site=self.site):
+        for cat in pywikibot.textlib.getCategoryLinks(self, site=self.site):
             if cat not in cats:
                 cats.append(cat)
 
@@ -2817,6 +2838,116 @@ class WikibasePage(Page):
         self.editEntity(data, **kwargs)
 
 
+class ClaimDict(dict):
+
+    """Claims of an item by property id, created when they are accessed.
+
+    Creating a Claim may need the type of its property and further objects
+    for its target, so the claims of a property are only created from the
+    JSON data when that property is looked up. Methods which return all
+    values create all remaining claims.
+    """
+
+    def __init__(self, item, data):
+        """
+        Constructor.
+
+        @param item: the item the claims are on
+        @type item: ItemPage
+        @param data: JSON claim data by property id
+        @type data: dict
+        """
+        super(ClaimDict, self).__init__()
+        self.item = item
+        self._data = dict(data)
+        for pid in data:
+            dict.__setitem__(self, pid, None)
+
+    def _load(self, pid):
+        """Create the claims of property pid if not done yet."""
+        if pid in self._data:
+            claims = []
+            for data in self._data.pop(pid):
+                c = Claim.fromJSON(self.item.repo, data)
+                c.on_item = self.item
+                claims.append(c)
+            dict.__setitem__(self, pid, claims)
+
+    def _load_all(self):
+        """Create all claims which have not been created yet."""
+        for pid in list(self._data.keys()):
+            self._load(pid)
+
+    def __getitem__(self, pid):
+        self._load(pid)
+        return dict.__getitem__(self, pid)
+
+    def __setitem__(self, pid, claims):
+        self._data.pop(pid, None)
+        dict.__setitem__(self, pid, claims)
+
+    def __delitem__(self, pid):
+        self._data.pop(pid, None)
+        dict.__delitem__(self, pid)
+
+    def get(self, pid, default=None):
+        self._load(pid)
+        return dict.get(self, pid, default)
+
+    def setdefault(self, pid, default=None):
+        self._load(pid)
+        return dict.setdefault(self, pid, default)
+
+    def pop(self, pid, *default):
+        self._load(pid)
+        return dict.pop(self, pid, *default)
+
+    def update(self, *args, **kwargs):
+        for pid, claims in dict(*args, **kwargs).items():
+            self[pid] = claims
+
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+    def itervalues(self):
+        self._load_all()
+        return dict.itervalues(self)
+
+    def iteritems(self):
+        self._load_all()
+        return dict.iteritems(self)
+
+    def popitem(self):
+        self._load_all()
+        return dict.popitem(self)
+
+    def copy(self):
+        self._load_all()
+        return dict.copy(self)
+
+    def __repr__(self):
+        self._load_all()
+        return dict.__repr__(self)
+
+    def __eq__(self, other):
+        self._load_all()
+        if isinstance(other, ClaimDict):
+            other._load_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        self._load_all()
+        return (dict, (dict(self),))
+
+
 class ItemPage(WikibasePage):
 
     """ A Wikibase item.
@@ -2872,15 +3003,8 @@ class ItemPage(WikibasePage):
         """
         super(ItemPage, self).get(force=force, *args, **kwargs)
 
-        # claims
-        self.claims = {}
-        if 'claims' in self._content:
-            for pid in self._content['claims']:
-                self.claims[pid] = list()
-                for claim in self._content['claims'][pid]:
-                    c = Claim.fromJSON(self.repo, claim)
-                    c.on_item = self
-                    self.claims[pid].append(c)
+        # claims are created when they are accessed
+        self.claims = ClaimDict(self, self._content.get('claims', {}))
 
         # sitelinks
         self.sitelinks = {}
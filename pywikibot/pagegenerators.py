@@ -20,15 +20,23 @@ __version__ = '$Id: aad6df123c3c69e4fbc1e6a4ea9234746ee9ba86 $'
 #
 
 import codecs
+import collections
 import itertools
 import re
+import sys
 import pywikibot
 from pywikibot import date
 from pywikibot import config
 from pywikibot import deprecate_arg, i18n
 from pywikibot.comms import http
+from pywikibot.tools import ThreadPool
 import pywikibot.data.wikidataquery as wdquery
 
+if sys.version_info[0] == 2:
+    import Queue
+else:
+    import queue as Queue
+
 # ported from version 1 for backwards-compatibility
 # most of these functions just wrap a Site or Page method that returns
 # a generator
@@ -975,8 +983,44 @@ def PageWithTalkPageGenerator(generator):
 
 @deprecate_arg("pageNumber", "step")
 @deprecate_arg("lookahead", None)
-def PreloadingGenerator(generator, step=50):
-    """Yield preloaded pages taken from another generator."""
+def PreloadingGenerator(generator, step=50, prefetch=None, ordered=True,
+                        inputorder=False):
+    """Yield preloaded pages taken from another generator.
+
+    @param generator: pages to iterate over
+    @param step: how many pages to preload at once
+    @param prefetch: how many groups of pages are preloaded in background
+        threads while the pages of an earlier group are yielded; defaults
+        to config.preload_prefetch. With 0, each group is preloaded only
+        when it is needed.
+    @type prefetch: int
+    @param ordered: if prefetching, yield the groups in the order they were
+        taken from the generator; otherwise yield each group as soon as it
+        has been preloaded
+    @type ordered: bool
+    @param inputorder: yield the pages of each group in the order they were
+        taken from the generator
+    @type inputorder: bool
+
+    If config.preload_site_threads is more than 1 and prefetch is 0, the
+    groups of different sites are preloaded concurrently, and each group is
+    yielded as soon as it has been preloaded; see L{_ConcurrentPreloader}.
+    """
+    if prefetch is None:
+        prefetch = config.preload_prefetch
+    if prefetch > 0:
+        for page in _PrefetchingPreloader(generator, step, prefetch, ordered,
+                                          'preloadpages',
+                                          inputorder=inputorder):
+            yield page
+        return
+    if config.preload_site_threads > 1:
+        for page in _ConcurrentPreloader(generator,
+                                         config.preload_site_threads, step,
+                                         'preloadpages',
+                                         inputorder=inputorder):
+            yield page
+        return
 
     # pages may be on more than one site, for example if an interwiki
     # generator is used, so use a separate preloader for each site
@@ -985,20 +1029,155 @@ def PreloadingGenerator(generator, step=50):
     for page in generator:
         site = page.site
         sites.setdefault(site, []).append(page)
-        if len(sites[site]) >= step:
+        if len(sites[site]) >= site.preload_groupsize(step):
             # if this site is at the step, process it
             group = sites[site]
             sites[site] = []
-            for i in site.preloadpages(group, step):
+            for i in site.preloadpages(group, step, inputorder=inputorder):
                 yield i
+    # process any leftover sites that never reached the step
     for site in sites:
         if sites[site]:
-            # process any leftover sites that never reached the step
-            for i in site.preloadpages(sites[site], step):
+            for i in site.preloadpages(sites[site], step,
+                                       inputorder=inputorder):
+                yield i
+
+
+def _preload_group(site, method, group, step, **kwargs):
+    """Return the pages of group preloaded by the given site method."""
+    return list(getattr(site, method)(group, step, **kwargs))
+
+
+def _ConcurrentPreloader(generator, workers, step, method, **kwargs):
+    """Yield pages preloaded by a site method, several sites concurrently.
+
+    The pages are grouped per site like in PreloadingGenerator, and each
+    group is preloaded in a pool of threads as soon as it is full. The
+    groups of one site are preloaded and yielded one after another, in the
+    order of the generator, while the groups of different sites are loaded
+    at the same time and yielded as soon as they have been preloaded. Every
+    site still throttles its own requests. No more pages are taken from the
+    generator while more than workers groups are waiting or loading.
+
+    @param workers: the maximum number of threads
+    @param method: name of the site method preloading a group of pages
+    @param kwargs: additional arguments of that method
+    """
+    pool = ThreadPool(workers=workers, name="PreloadThread")
+    # (site, future) of the preloaded groups
+    done = Queue.Queue()
+    # full groups waiting for the group being loaded on their site
+    waiting = {}
+    # sites on which a group is being loaded
+    loading = set()
+
+    def submit(site):
+        group = waiting[site].popleft()
+        if not waiting[site]:
+            del waiting[site]
+        loading.add(site)
+        future = pool.submit(_preload_group, site, method, group, step,
+                             **kwargs)
+        future.add_done_callback(lambda future: done.put((site, future)))
+
+    def add(site, group):
+        waiting.setdefault(site, collections.deque()).append(group)
+        if site not in loading:
+            submit(site)
+
+    def next_group():
+        site, future = done.get()
+        loading.remove(site)
+        if site in waiting:
+            submit(site)
+        return future.result()
+
+    try:
+        groups = {}
+        for page in generator:
+            site = page.site
+            groups.setdefault(site, []).append(page)
+            if method == 'preloadpages':
+                groupsize = site.preload_groupsize(step)
+            else:
+                groupsize = step
+            if len(groups[site]) >= groupsize:
+                add(site, groups.pop(site))
+            # yield the groups which have been preloaded meanwhile
+            while not done.empty() or \
+                    len(loading) + sum(map(len, waiting.values())) > workers:
+                for i in next_group():
+                    yield i
+        for site, group in groups.items():
+            add(site, group)
+        while loading:
+            for i in next_group():
                 yield i
+    finally:
+        pool.shutdown()
+
 
+def _PrefetchingPreloader(generator, step, prefetch, ordered, method,
+                          **kwargs):
+    """Yield pages preloaded by a site method in background threads.
 
-def PreloadingItemGenerator(generator, step=50):
+    The pages are grouped per site like in PreloadingGenerator. Up to
+    prefetch groups are submitted to a pool of as many threads, so that the
+    next groups are loaded while the pages of the current group are
+    processed. No more groups are taken from the generator until one of
+    them has been yielded, which bounds the number of pages held in memory.
+
+    @param method: name of the site method preloading a group of pages
+    @param kwargs: additional arguments of that method
+    """
+    pool = ThreadPool(workers=prefetch, name="PreloadThread")
+    # futures of the submitted groups; if the groups don't need to be yielded
+    # in order, finished futures are also put into the done queue
+    pending = collections.deque()
+    done = Queue.Queue()
+
+    def submit(site, group):
+        future = pool.submit(_preload_group, site, method, group, step,
+                             **kwargs)
+        if not ordered:
+            future.add_done_callback(done.put)
+        pending.append(future)
+
+    def next_group():
+        if ordered:
+            future = pending.popleft()
+        else:
+            future = done.get()
+            pending.remove(future)
+        return future.result()
+
+    try:
+        sites = {}
+        for page in generator:
+            site = page.site
+            sites.setdefault(site, []).append(page)
+            if method == 'preloadpages':
+                groupsize = site.preload_groupsize(step)
+            else:
+                groupsize = step
+            if len(sites[site]) >= groupsize:
+                submit(site, sites[site])
+                sites[site] = []
+                while len(pending) > prefetch:
+                    for i in next_group():
+                        yield i
+        for site in sites:
+            if sites[site]:
+                submit(site, sites[site])
+        while pending:
+            for i in next_group():
+                yield i
+    finally:
+        pool.shutdown()
+
+
+def PreloadingItemGenerator(generator, step=50, prefetch=None, ordered=True,
+                            props=None, languages=None):
     """
     Yield preloaded pages taken from another generator.
 
@@ -1006,7 +1185,27 @@ def PreloadingItemGenerator(generator, step=50):
 
     @param generator: pages to iterate over
     @param step: how many pages to preload at once
+    @param prefetch: how many groups of pages are preloaded in background
+        threads while the pages of an earlier group are yielded; defaults
+        to config.preload_prefetch
+    @type prefetch: int
+    @param ordered: if prefetching, yield the groups in the order they were
+        taken from the generator
+    @type ordered: bool
+    @param props: the parts of the entities to load, e.g.
+        'labels|claims|sitelinks'; see DataSite.preloaditempages
+    @param languages: the languages of labels, descriptions and aliases to
+        load, e.g. 'en|de'
     """
+    if prefetch is None:
+        prefetch = config.preload_prefetch
+    if prefetch > 0:
+        for page in _PrefetchingPreloader(generator, step, prefetch, ordered,
+                                          'preloaditempages', props=props,
+                                          languages=languages):
+            yield page
+        return
+
     sites = {}
     for page in generator:
         site = page.site
@@ -1015,12 +1214,13 @@ def PreloadingItemGenerator(generator, step=50):
             # if this site is at the step, process it
             group = sites[site]
             sites[site] = []
-            for i in site.preloaditempages(group, step):
+            for i in site.preloaditempages(group, step, props, languages):
                 yield i
     for site in sites:
         if sites[site]:
             # process any leftover sites that never reached the step
-            for i in site.preloaditempages(sites[site], step):
+            for i in site.preloaditempages(sites[site], step, props,
+                                           languages):
                 yield i
 
 
@@ -176,8 +176,10 @@ class BaseSite(object):
             self.code in self.family.use_hard_category_redirects)
 
         # following are for use with lock_page and unlock_page methods
-        self._pagemutex = threading.Lock()
-        self._locked_pages = []
+        self._pagemutex = threading.Condition()
+        self._locked_pages = set()
+        self._lock_stats = {'locked': 0, 'contended': 0, 'timeouts': 0,
+                            'waited': 0.0}
 
     @property
     def throttle(self):
@@ -224,12 +226,16 @@ class BaseSite(object):
         del new['_pagemutex']
         if '_throttle' in new:
             del new['_throttle']
+        if '_property_batcher' in new:
+            del new['_property_batcher']
+        if '_preload_sizer' in new:
+            del new['_preload_sizer']
         return new
 
     def __setstate__(self, attrs):
         """ Restore things removed in __getstate__. """
         self.__dict__.update(attrs)
-        self._pagemutex = threading.Lock()
+        self._pagemutex = threading.Condition()
 
     def user(self):
         """Return the currently-logged in bot user, or None."""
@@ -319,7 +325,7 @@ class BaseSite(object):
         """Return list of localized PAGENAMEE tags for the site."""
         return [u"PAGENAMEE"]
 
-    def lock_page(self, page, block=True):
+    def lock_page(self, page, block=True, timeout=None):
         """Lock page for writing.  Must be called before writing any page.
 
         We don't want different threads trying to write to the same page
@@ -329,15 +335,34 @@ class BaseSite(object):
         @type page: pywikibot.Page
         @param block: if true, wait until the page is available to be locked;
             otherwise, raise an exception if page can't be locked
+        @param timeout: if blocking, the maximum number of seconds to wait
+            before raising an exception; by default wait until the page is
+            unlocked
+        @type timeout: float
 
         """
+        title = page.title(withSection=False)
         self._pagemutex.acquire()
         try:
-            while page in self._locked_pages:
+            if title in self._locked_pages:
+                self._lock_stats['contended'] += 1
                 if not block:
-                    raise PageInUse
-                time.sleep(.25)
-            self._locked_pages.append(page.title(withSection=False))
+                    raise PageInUse(title)
+                started = time.time()
+                try:
+                    while title in self._locked_pages:
+                        if timeout is None:
+                            self._pagemutex.wait()
+                            continue
+                        remaining = started + timeout - time.time()
+                        if remaining <= 0:
+                            self._lock_stats['timeouts'] += 1
+                            raise PageInUse(title)
+                        self._pagemutex.wait(remaining)
+                finally:
+                    self._lock_stats['waited'] += time.time() - started
+            self._locked_pages.add(title)
+            self._lock_stats['locked'] += 1
         finally:
             self._pagemutex.release()
 
@@ -350,7 +375,25 @@ class BaseSite(object):
         """
         self._pagemutex.acquire()
         try:
-            self._locked_pages.remove(page.title(withSection=False))
+            try:
+                self._locked_pages.remove(page.title(withSection=False))
+            except KeyError:
+                raise ValueError(page.title(withSection=False))
+            self._pagemutex.notifyAll()
+        finally:
+            self._pagemutex.release()
+
+    def lock_stats(self):
+        """Return statistics about the page locks of this Site.
+
+        The dict contains the number of pages locked, of attempts to lock
+        a page which was already locked, of those which timed out, and the
+        total number of seconds spent waiting for locked pages.
+
+        """
+        self._pagemutex.acquire()
+        try:
+            return dict(self._lock_stats)
         finally:
             self._pagemutex.release()
 
@@ -1367,57 +1410,72 @@ class APISite(BaseSite):
         except api.APIError:  # May occur if you are not logged in (no API read permissions).
             return (0, 0, 0)
 
+    @property
+    def property_batcher(self):
+        """Return this Site's PropertyBatcher.  Initialize a new one if needed."""
+        if not hasattr(self, "_property_batcher"):
+            self._property_batcher = api.PropertyBatcher(self)
+        return self._property_batcher
+
+    def preload_groupsize(self, groupsize=50):
+        """Return the number of pages to preload with the next request.
+
+        If config.preload_adaptive is True, the group size is adapted to the
+        length and duration of the responses to preloadpages, starting with
+        groupsize and within the limit for the number of titles in one
+        request set by the API: 500 for users with the apihighlimits right,
+        otherwise 50. Otherwise groupsize is returned.
+
+        @param groupsize: the group size requested by the caller
+        @type groupsize: int
+
+        """
+        if not config.preload_adaptive:
+            return groupsize
+        if not hasattr(self, "_preload_sizer"):
+            if self.logged_in() and self.has_right('apihighlimits'):
+                maximum = 500
+            else:
+                maximum = 50
+            self._preload_sizer = api.BatchSizer(groupsize, maximum)
+        return self._preload_sizer.size
+
+    def _loadpageprop(self, page, caller, prop, **params):
+        """Query a property of page and store it in page attributes.
+
+        The query is sent through the site's PropertyBatcher, so that
+        queries on several pages can share one API request.
+
+        @param caller: name of the calling method, used in warnings
+        @param prop: the "property=" type from api.php
+        @return: the "page" element of the query response, or None
+
+        """
+        title = page.title(withSection=False)
+        pageitem = self.property_batcher.submit(title, prop,
+                                                **params).result()
+        if pageitem is None:
+            pywikibot.warning(u"%s: Query on %s returned no data"
+                              % (caller, page))
+            return None
+        api.update_page(page, pageitem)
+        return pageitem
+
     def loadpageinfo(self, page, preload=False):
         """Load page info from api and store in page attributes."""
-        title = page.title(withSection=False)
         inprop = 'protection'
         if preload:
             inprop += '|preload'
-
-        query = self._generator(api.PropertyGenerator,
-                                type_arg="info",
-                                titles=title.encode(self.encoding()),
-                                inprop=inprop)
-
-        for pageitem in query:
-            if not self.sametitle(pageitem['title'], title):
-                pywikibot.warning(
-                    u"loadpageinfo: Query on %s returned data on '%s'"
-                    % (page, pageitem['title']))
-                continue
-            api.update_page(page, pageitem)
+        self._loadpageprop(page, "loadpageinfo", "info", inprop=inprop)
 
     def loadcoordinfo(self, page):
         """Load [[mw:Extension:GeoData]] info."""
-        title = page.title(withSection=False)
-        query = self._generator(api.PropertyGenerator,
-                                type_arg="coordinates",
-                                titles=title.encode(self.encoding()),
-                                coprop=['type', 'name', 'dim',
-                                        'country', 'region',
-                                        'globe'],
-                                coprimary='all')
-        for pageitem in query:
-            if not self.sametitle(pageitem['title'], title):
-                pywikibot.warning(
-                    u"loadcoordinfo: Query on %s returned data on '%s'"
-                    % (page, pageitem['title']))
-                continue
-            api.update_page(page, pageitem)
+        self._loadpageprop(page, "loadcoordinfo", "coordinates",
+                           coprop="type|name|dim|country|region|globe",
+                           coprimary='all')
 
     def loadpageprops(self, page):
-        title = page.title(withSection=False)
-        query = self._generator(api.PropertyGenerator,
-                                type_arg="pageprops",
-                                titles=title.encode(self.encoding()),
-                                )
-        for pageitem in query:
-            if not self.sametitle(pageitem['title'], title):
-                pywikibot.warning(
-                    u"loadpageprops: Query on %s returned data on '%s'"
-                    % (page, pageitem['title']))
-                continue
-            api.update_page(page, pageitem)
+        self._loadpageprop(page, "loadpageprops", "pageprops")
 
     def loadimageinfo(self, page, history=False):
         """Load image info from api and save in page attributes.
@@ -1450,18 +1508,7 @@ class APISite(BaseSite):
 
         FIXME: Assumes that the Flow extension is installed.
         """
-        title = page.title(withSection=False)
-        query = self._generator(api.PropertyGenerator,
-                                type_arg="flowinfo",
-                                titles=title.encode(self.encoding()),
-                                )
-        for pageitem in query:
-            if not self.sametitle(pageitem['title'], title):
-                pywikibot.warning(
-                    u"loadflowinfo: Query on %s returned data on '%s'"
-                    % (page, pageitem['title']))
-                continue
-            api.update_page(page, pageitem)
+        self._loadpageprop(page, "loadflowinfo", "flowinfo")
 
     def page_exists(self, page):
         """Return True if and only if page is an existing page on site."""
@@ -1550,21 +1597,29 @@ class APISite(BaseSite):
         return page._redirtarget
 
     def preloadpages(self, pagelist, groupsize=50, templates=False,
-                     langlinks=False):
+                     langlinks=False, inputorder=False):
         """Return a generator to a list of preloaded pages.
 
-        Note that [at least in current implementation] pages may be iterated
-        in a different order than in the underlying pagelist.
+        Unless inputorder is True, pages may be iterated in a different
+        order than in the underlying pagelist.
 
         @param pagelist: an iterable that returns Page objects
         @param groupsize: how many Pages to query at a time
         @type groupsize: int
         @param templates: preload list of templates in the pages
         @param langlinks: preload list of language links found in the pages
+        @param inputorder: yield the pages in the order of pagelist; a page
+            is then held back until the pages before it in its group have
+            been loaded
+        @type inputorder: bool
 
         """
-        from pywikibot.tools import itergroup
-        for sublist in itergroup(pagelist, groupsize):
+        pagelist = iter(pagelist)
+        while True:
+            sublist = list(itertools.islice(
+                pagelist, self.preload_groupsize(groupsize)))
+            if not sublist:
+                break
             pageids = [str(p._pageid) for p in sublist
                        if hasattr(p, "_pageid") and p._pageid > 0]
             cache = dict((p.title(withSection=False), p) for p in sublist)
@@ -1579,39 +1634,75 @@ class APISite(BaseSite):
             if len(pageids) == len(sublist):
                 # only use pageids if all pages have them
                 rvgen.request["pageids"] = "|".join(pageids)
+                byid = dict((p._pageid, p) for p in sublist)
             else:
                 rvgen.request["titles"] = "|".join(list(cache.keys()))
+                byid = {}
             rvgen.request[u"rvprop"] = u"ids|flags|timestamp|user|comment|content"
             pywikibot.output(u"Retrieving %s pages from %s."
                              % (len(cache), self))
+            # API returns a "normalized" title which is usually the same as
+            # the canonical form returned by page.title(), but sometimes not
+            # (e.g., gender-specific localizations of "User" namespace). Map
+            # these titles back to the titles used in the query.
+            origin = {}
+            response = None
+            size = 0
+            latency = 0.0
+            # pages of sublist which have been loaded, by id(); used to
+            # yield them in input order
+            loaded = set()
+            position = 0
             for pagedata in rvgen:
                 pywikibot.debug(u"Preloading %s" % pagedata, _logger)
-                try:
-                    if pagedata['title'] not in cache:
-                        # API always returns a "normalized" title which is
-                        # usually the same as the canonical form returned by
-                        # page.title(), but sometimes not (e.g.,
-                        # gender-specific localizations of "User" namespace).
-                        # This checks to see if there is a normalized title in
-                        # the response that corresponds to the canonical form
-                        # used in the query.
+                if rvgen.data is not response:
+                    response = rvgen.data
+                    size += rvgen.response_size
+                    latency += rvgen.response_time
+                    for item in response['query'].get('normalized', []):
+                        origin[item['to']] = item['from']
+                if pagedata.get('pageid') in byid:
+                    page = byid[pagedata['pageid']]
+                elif 'title' not in pagedata:
+                    pywikibot.debug(u"No 'title' in %s" % pagedata, _logger)
+                    pywikibot.debug(u"pageids=%s" % pageids, _logger)
+                    pywikibot.debug(u"titles=%s" % list(cache.keys()), _logger)
+                    continue
+                else:
+                    title = pagedata['title']
+                    if title not in cache:
+                        title = origin.get(title, title)
+                    if title not in cache:
+                        # This checks to see if there is a title in the
+                        # query which is the same as the one in the
+                        # response, but not mapped to it by the API.
                         for key in cache:
                             if self.sametitle(key, pagedata['title']):
-                                cache[pagedata['title']] = cache[key]
+                                title = key
                                 break
                         else:
                             pywikibot.warning(
-                                u"preloadpages: Query returned unexpected title"
-                                u"'%s'" % pagedata['title'])
+                                u"preloadpages: Query returned unexpected "
+                                u"title '%s'" % pagedata['title'])
                             continue
-                except KeyError:
-                    pywikibot.debug(u"No 'title' in %s" % pagedata, _logger)
-                    pywikibot.debug(u"pageids=%s" % pageids, _logger)
-                    pywikibot.debug(u"titles=%s" % list(cache.keys()), _logger)
-                    continue
-                page = cache[pagedata['title']]
+                    page = cache[title]
                 api.update_page(page, pagedata)
-                yield page
+                if not inputorder:
+                    yield page
+                    continue
+                loaded.add(id(page))
+                while position < len(sublist) \
+                        and id(sublist[position]) in loaded:
+                    yield sublist[position]
+                    position += 1
+            if inputorder:
+                # pages which were not returned, e.g. duplicates in pagelist,
+                # don't hold back the pages after them
+                for page in sublist[position:]:
+                    if id(page) in loaded:
+                        yield page
+            if hasattr(self, "_preload_sizer"):
+                self._preload_sizer.feedback(len(sublist), size, latency)
 
     def token(self, page, tokentype):
         """Return token retrieved from wiki to allow changing page content.
@@ -1621,19 +1712,15 @@ class APISite(BaseSite):
             see API documentation for full list of types
 
         """
-        query = api.PropertyGenerator("info",
-                                      titles=page.title(withSection=False),
-                                      intoken=tokentype,
-                                      site=self)
-        for item in query:
-            if not self.sametitle(item['title'], page.title(withSection=False)):
-                raise Error(
-                    u"token: Query on page %s returned data on page [[%s]]"
-                    % (page.title(withSection=False, asLink=True),
-                       item['title']))
-            api.update_page(page, item)
-            pywikibot.debug(unicode(item), _logger)
-            return item[tokentype + "token"]
+        title = page.title(withSection=False)
+        item = self.property_batcher.submit(title, "info",
+                                            intoken=tokentype).result()
+        if item is None:
+            raise Error(u"token: Query on page %s returned no data"
+                        % page.title(withSection=False, asLink=True))
+        api.update_page(page, item)
+        pywikibot.debug(unicode(item), _logger)
+        return item[tokentype + "token"]
 
     # following group of methods map more-or-less directly to API queries
 
@@ -2884,118 +2971,117 @@ class APISite(BaseSite):
         # if the page is updated after the token is retrieved but
         # before the page is saved.
         self.lock_page(page)
-        if lastrev is not None and page.latestRevision() != lastrev:
-            raise EditConflict(
-                "editpage: Edit conflict detected; saving aborted.")
-        params = dict(action="edit",
-                      title=page.title(withSection=False),
-                      text=text, token=token, summary=summary)
-        if bot:
-            params["bot"] = ""
-        if lastrev is not None:
-            if lastrev not in page._revisions:
-                self.loadrevisions(page)
-            params["basetimestamp"] = page._revisions[lastrev].timestamp
-        if minor:
-            params['minor'] = ""
-        elif notminor:
-            params['notminor'] = ""
-        if recreate:
-            params['recreate'] = ""
-        if createonly:
-            params['createonly'] = ""
-        if nocreate:
-            params['nocreate'] = ""
-        if watch in ["watch", "unwatch", "preferences", "nochange"]:
-            params['watchlist'] = watch
-        elif watch:
-            pywikibot.warning(
-                u"editpage: Invalid watch value '%(watch)s' ignored."
-                % locals())
-        req = api.Request(site=self, **params)
-        while True:
-            try:
-                result = req.submit()
-                pywikibot.debug(u"editpage response: %s" % result,
-                                _logger)
-            except api.APIError as err:
-                self.unlock_page(page)
-                if err.code.endswith("anon") and self.logged_in():
+        try:
+            if lastrev is not None and page.latestRevision() != lastrev:
+                raise EditConflict(
+                    "editpage: Edit conflict detected; saving aborted.")
+            params = dict(action="edit",
+                          title=page.title(withSection=False),
+                          text=text, token=token, summary=summary)
+            if bot:
+                params["bot"] = ""
+            if lastrev is not None:
+                if lastrev not in page._revisions:
+                    self.loadrevisions(page)
+                params["basetimestamp"] = page._revisions[lastrev].timestamp
+            if minor:
+                params['minor'] = ""
+            elif notminor:
+                params['notminor'] = ""
+            if recreate:
+                params['recreate'] = ""
+            if createonly:
+                params['createonly'] = ""
+            if nocreate:
+                params['nocreate'] = ""
+            if watch in ["watch", "unwatch", "preferences", "nochange"]:
+                params['watchlist'] = watch
+            elif watch:
+                pywikibot.warning(
+                    u"editpage: Invalid watch value '%(watch)s' ignored."
+                    % locals())
+            req = api.Request(site=self, **params)
+            while True:
+                try:
+                    result = req.submit()
+                    pywikibot.debug(u"editpage response: %s" % result,
+                                    _logger)
+                except api.APIError as err:
+                    if err.code.endswith("anon") and self.logged_in():
+                        pywikibot.debug(
+                            u"editpage: received '%s' even though bot is "
+                            u"logged in" % err.code,
+                            _logger)
+                    errdata = {
+                        'site': self,
+                        'title': page.title(withSection=False),
+                        'user': self.user(),
+                        'info': err.info
+                    }
+                    if err.code == "spamdetected":
+                        raise SpamfilterError(
+                            self._ep_errors[err.code] % errdata
+                            + err.info[err.info.index("fragment: ") + 9:])
+
+                    if err.code == "editconflict":
+                        raise EditConflict(self._ep_errors[err.code] % errdata)
+                    if err.code in ("protectedpage", "cascadeprotected"):
+                        raise LockedPage(errdata['title'])
+                    if err.code in self._ep_errors:
+                        raise Error(self._ep_errors[err.code] % errdata)
                     pywikibot.debug(
-                        u"editpage: received '%s' even though bot is logged in"
+                        u"editpage: Unexpected error code '%s' received."
                         % err.code,
                         _logger)
-                errdata = {
-                    'site': self,
-                    'title': page.title(withSection=False),
-                    'user': self.user(),
-                    'info': err.info
-                }
-                if err.code == "spamdetected":
-                    raise SpamfilterError(
-                        self._ep_errors[err.code] % errdata
-                        + err.info[err.info.index("fragment: ") + 9:])
-
-                if err.code == "editconflict":
-                    raise EditConflict(self._ep_errors[err.code] % errdata)
-                if err.code in ("protectedpage", "cascadeprotected"):
-                    raise LockedPage(errdata['title'])
-                if err.code in self._ep_errors:
-                    raise Error(self._ep_errors[err.code] % errdata)
-                pywikibot.debug(
-                    u"editpage: Unexpected error code '%s' received."
-                    % err.code,
-                    _logger)
-                raise
-            assert ("edit" in result and "result" in result["edit"]), result
-            if result["edit"]["result"] == "Success":
-                self.unlock_page(page)
-                if "nochange" in result["edit"]:
-                    # null edit, page not changed
-                    pywikibot.log(u"Page [[%s]] saved without any changes."
-                                  % page.title())
+                    raise
+                assert ("edit" in result
+                        and "result" in result["edit"]), result
+                if result["edit"]["result"] == "Success":
+                    if "nochange" in result["edit"]:
+                        # null edit, page not changed
+                        pywikibot.log(u"Page [[%s]] saved without any changes."
+                                      % page.title())
+                        return True
+                    page._revid = result["edit"]["newrevid"]
+                    # see https://www.mediawiki.org/wiki/API:Wikimania_2006_API_discussion#Notes
+                    # not safe to assume that saved text is the same as sent
+                    self.loadrevisions(page, getText=True)
                     return True
-                page._revid = result["edit"]["newrevid"]
-                # see https://www.mediawiki.org/wiki/API:Wikimania_2006_API_discussion#Notes
-                # not safe to assume that saved text is the same as sent
-                self.loadrevisions(page, getText=True)
-                return True
-            elif result["edit"]["result"] == "Failure":
-                if "captcha" in result["edit"]:
-                    captcha = result["edit"]["captcha"]
-                    req['captchaid'] = captcha['id']
-                    if captcha["type"] == "math":
-                        req['captchaword'] = input(captcha["question"])
-                        continue
-                    elif "url" in captcha:
-                        import webbrowser
-                        webbrowser.open('%s://%s%s'
-                                        % (self.protocol(),
-                                           self.hostname(),
-                                           captcha["url"]))
-                        req['captchaword'] = pywikibot.input(
-                            "Please view CAPTCHA in your browser, "
-                            "then type answer here:")
-                        continue
+                elif result["edit"]["result"] == "Failure":
+                    if "captcha" in result["edit"]:
+                        captcha = result["edit"]["captcha"]
+                        req['captchaid'] = captcha['id']
+                        if captcha["type"] == "math":
+                            req['captchaword'] = input(captcha["question"])
+                            continue
+                        elif "url" in captcha:
+                            import webbrowser
+                            webbrowser.open('%s://%s%s'
+                                            % (self.protocol(),
+                                               self.hostname(),
+                                               captcha["url"]))
+                            req['captchaword'] = pywikibot.input(
+                                "Please view CAPTCHA in your browser, "
+                                "then type answer here:")
+                            continue
+                        else:
+                            pywikibot.error(
+                                u"editpage: unknown CAPTCHA response %s, "
+                                u"page not saved"
+                                % captcha)
+                            return False
                     else:
-                        self.unlock_page(page)
-                        pywikibot.error(
-                            u"editpage: unknown CAPTCHA response %s, "
-                            u"page not saved"
-                            % captcha)
+                        pywikibot.error(u"editpage: unknown failure reason %s"
+                                        % str(result))
                         return False
                 else:
-                    self.unlock_page(page)
-                    pywikibot.error(u"editpage: unknown failure reason %s"
-                                    % str(result))
+                    pywikibot.error(
+                        u"editpage: Unknown result code '%s' received; "
+                        u"page not saved" % result["edit"]["result"])
+                    pywikibot.log(str(result))
                     return False
-            else:
-                self.unlock_page(page)
-                pywikibot.error(
-                    u"editpage: Unknown result code '%s' received; "
-                    u"page not saved" % result["edit"]["result"])
-                pywikibot.log(str(result))
-                return False
+        finally:
+            self.unlock_page(page)
 
     # catalog of move errors for use in error messages
     _mv_errors = {
@@ -3051,14 +3137,14 @@ class APISite(BaseSite):
                         % (oldtitle, self))
         token = self.token(page, "move")
         self.lock_page(page)
-        req = api.Request(site=self, action="move", to=newtitle,
-                          token=token, reason=summary)
-        req['from'] = oldtitle  # "from" is a python keyword
-        if movetalk:
-            req['movetalk'] = ""
-        if noredirect:
-            req['noredirect'] = ""
         try:
+            req = api.Request(site=self, action="move", to=newtitle,
+                              token=token, reason=summary)
+            req['from'] = oldtitle  # "from" is a python keyword
+            if movetalk:
+                req['movetalk'] = ""
+            if noredirect:
+                req['noredirect'] = ""
             result = req.submit()
             pywikibot.debug(u"movepage response: %s" % result,
                             _logger)
@@ -3129,12 +3215,12 @@ class APISite(BaseSite):
                 % page.title(asLink=True))
         token = self.token(page, "rollback")
         self.lock_page(page)
-        req = api.Request(site=self, action="rollback",
-                          title=page.title(withSection=False),
-                          user=last_user,
-                          token=token,
-                          **kwargs)
         try:
+            req = api.Request(site=self, action="rollback",
+                              title=page.title(withSection=False),
+                              user=last_user,
+                              token=token,
+                              **kwargs)
             req.submit()
         except api.APIError as err:
             errdata = {
@@ -3169,10 +3255,10 @@ class APISite(BaseSite):
         """
         token = self.token(page, "delete")
         self.lock_page(page)
-        req = api.Request(site=self, action="delete", token=token,
-                          title=page.title(withSection=False),
-                          reason=summary)
         try:
+            req = api.Request(site=self, action="delete", token=token,
+                              title=page.title(withSection=False),
+                              reason=summary)
             req.submit()
         except api.APIError as err:
             errdata = {
@@ -3215,18 +3301,18 @@ class APISite(BaseSite):
         """
         token = self.token(page, "protect")
         self.lock_page(page)
-
-        protectList = [type + '=' + level for type, level in protections.items()
-                       if level is not None]
-        req = api.Request(site=self, action="protect", token=token,
-                          title=page.title(withSection=False),
-                          protections=protectList,
-                          reason=summary)
-        if isinstance(expiry, pywikibot.Timestamp):
-            expiry = expiry.toISOformat()
-        if expiry:
-            req['expiry'] = expiry
         try:
+            protectList = [type + '=' + level
+                           for type, level in protections.items()
+                           if level is not None]
+            req = api.Request(site=self, action="protect", token=token,
+                              title=page.title(withSection=False),
+                              protections=protectList,
+                              reason=summary)
+            if isinstance(expiry, pywikibot.Timestamp):
+                expiry = expiry.toISOformat()
+            if expiry:
+                req['expiry'] = expiry
             req.submit()
         except api.APIError as err:
             errdata = {
@@ -3780,23 +3866,44 @@ class DataSite(APISite):
             raise api.APIError(data['errors'])
         return data['entities']
 
-    def preloaditempages(self, pagelist, groupsize=50):
+    def preloaditempages(self, pagelist, groupsize=50, props=None,
+                         languages=None):
         """Yield ItemPages with content prefilled.
 
         Note that pages will be iterated in a different order
         than in the underlying pagelist.
 
+        Loading only some parts of the entities reduces the size of the
+        responses. The other parts are missing from the items until they
+        are loaded with get(force=True).
+
         @param pagelist: an iterable that yields ItemPage objects
         @param groupsize: how many pages to query at a time
         @type groupsize: int
+        @param props: the parts of the entities to load, e.g.
+            'labels|claims|sitelinks'; 'info' is always loaded. By default
+            all parts are loaded.
+        @type props: str or list
+        @param languages: load labels, descriptions and aliases only in
+            these languages, e.g. 'en|de'. By default all languages are
+            loaded.
+        @type languages: str or list
         """
         from pywikibot.tools import itergroup
+        params = {}
+        if props:
+            if isinstance(props, basestring):
+                props = props.split('|')
+            params['props'] = sorted(set(props) | set(['info']))
+        if languages:
+            params['languages'] = languages
         for sublist in itergroup(pagelist, groupsize):
             req = {'ids': [], 'titles': [], 'sites': []}
             for p in sublist:
                 ident = p._defined_by()
                 for key in ident:
                     req[key].append(ident[key])
+            req.update(params)
 
             req = api.Request(site=self, action='wbgetentities', **req)
             data = req.submit()
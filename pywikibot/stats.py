@@ -0,0 +1,166 @@
+# -*- coding: utf-8  -*-
+"""
+Statistics about the requests made to wiki sites.
+
+Collection is disabled unless config.request_stats is True or enable()
+has been called; recording functions then return immediately. The
+counters are aggregated per site and per API module (e.g. 'query+allpages'
+or 'edit') and can be read with get() or written to the log with dump(),
+which stopme() does automatically when collection is enabled. All HTTP
+requests, including those which are not API requests, are also counted
+under the module name 'http', and api.update_page() under 'update_page'.
+
+Counters used by the framework:
+    - requests: number of requests sent
+    - throttle: seconds spent waiting for the site's throttle
+    - queue: seconds requests waited for an HTTP thread
+    - network: seconds spent sending requests and receiving responses
+    - decode: seconds spent decoding JSON responses
+    - bytes: number of bytes received
+    - retries: number of requests repeated after an error
+    - maxlag_waits, maxlag: number of and seconds spent in maxlag pauses
+    - calls, seconds: number of and seconds spent in update_page() calls
+
+Values which change over time, like the delays of an adaptive throttle,
+are recorded as timestamped samples with sample() and read with
+get_samples().
+"""
+#
+# (C) Pywikibot team, 2014
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+#
+
+import collections
+import threading
+import time
+
+import pywikibot
+from pywikibot import config
+
+_logger = "stats"
+
+enabled = config.request_stats
+
+# per thread data, e.g. the timings of the last HTTP request
+local = threading.local()
+
+_counters = {}
+_samples = {}
+_lock = threading.Lock()
+
+# number of samples kept for each site and name
+max_samples = 1000
+
+
+def enable(state=True):
+    """Switch the collection of statistics on or off."""
+    global enabled
+    enabled = state
+
+
+def add(site, module, **values):
+    """Add values to the counters of module on site.
+
+    @param site: the Site the values refer to, or None
+    @param module: the API module or another name of the activity
+    @type module: str
+    @param values: counter names and the amount to add
+
+    """
+    if not enabled:
+        return
+    key = (str(site), module)
+    _lock.acquire()
+    try:
+        counters = _counters.setdefault(key, {})
+        for name, value in values.items():
+            counters[name] = counters.get(name, 0) + value
+    finally:
+        _lock.release()
+
+
+def get(site=None, module=None):
+    """Return a copy of the counters.
+
+    @param site: only return counters of this Site
+    @param module: only return counters of this module
+    @return: dict mapping (site name, module) tuples to dicts of counters
+
+    """
+    _lock.acquire()
+    try:
+        return dict((key, dict(counters))
+                    for key, counters in _counters.items()
+                    if (site is None or key[0] == str(site))
+                    and (module is None or key[1] == module))
+    finally:
+        _lock.release()
+
+
+def sample(site, name, value):
+    """Record the current value of name on site.
+
+    Only the latest max_samples samples are kept for each site and name.
+
+    @param site: the Site the value refers to, or None
+    @param name: the name of the value, e.g. 'read_delay'
+    @type name: str
+
+    """
+    if not enabled:
+        return
+    key = (str(site), name)
+    _lock.acquire()
+    try:
+        if key not in _samples:
+            _samples[key] = collections.deque(maxlen=max_samples)
+        _samples[key].append((time.time(), value))
+    finally:
+        _lock.release()
+
+
+def get_samples(site=None, name=None):
+    """Return a copy of the samples.
+
+    @param site: only return samples of this Site
+    @param name: only return samples with this name
+    @return: dict mapping (site name, name) tuples to lists of
+        (timestamp, value) tuples
+
+    """
+    _lock.acquire()
+    try:
+        return dict((key, list(values))
+                    for key, values in _samples.items()
+                    if (site is None or key[0] == str(site))
+                    and (name is None or key[1] == name))
+    finally:
+        _lock.release()
+
+
+def reset():
+    """Clear all counters and samples."""
+    _lock.acquire()
+    try:
+        _counters.clear()
+        _samples.clear()
+    finally:
+        _lock.release()
+
+
+def dump():
+    """Write all counters and the last value of all samples to the log."""
+    for (site, module), counters in sorted(get().items()):
+        values = u", ".join(
+            u"%s=%s" % (name, (u"%.3f" % value)
+                        if isinstance(value, float) else value)
+            for name, value in sorted(counters.items()))
+        pywikibot.log(u"Request statistics for %s %s: %s"
+                      % (site, module, values))
+    for (site, name), values in sorted(get_samples().items()):
+        timestamp, value = values[-1]
+        pywikibot.log(u"Last %s of %s: %s (%i samples)"
+                      % (name, site, value, len(values)))
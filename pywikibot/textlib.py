@@ -19,8 +19,11 @@ try:
 except ImportError:
     mwparserfromhell = False
 import pywikibot
+import bisect
 import datetime
 import re
+import sre_constants
+import sre_parse
 import sys
 if sys.version_info[0] == 2:
     from HTMLParser import HTMLParser
@@ -45,6 +48,62 @@ def unescape(s):
     return s
 
 
+# named exceptions of replaceExcept() which don't depend on the site
+_exception_regexes = {}
+# named exceptions of replaceExcept() built from site data, by site
+_site_exception_regexes = {}
+
+
+def _get_exception_regexes(site):
+    """Return the named exception regexes of replaceExcept() for site.
+
+    The regexes are compiled once; those built from site data are cached
+    for each site.
+
+    """
+    if not _exception_regexes:
+        _exception_regexes.update({
+            'comment':      re.compile(r'(?s)<!--.*?-->'),
+            # section headers
+            'header':       re.compile(r'\r?\n=+.+=+ *\r?\n'),
+            # preformatted text
+            'pre':          re.compile(r'(?ism)<pre>.*?</pre>'),
+            'source':       re.compile(r'(?is)<source .*?</source>'),
+            # inline references
+            'ref':          re.compile(r'(?ism)<ref[ >].*?</ref>'),
+            # lines that start with a space are shown in a monospace font and
+            # have whitespace preserved.
+            'startspace':   re.compile(r'(?m)^ (.*?)$'),
+            # tables often have whitespace that is used to improve wiki
+            # source code readability.
+            # TODO: handle nested tables.
+            'table':        re.compile(r'(?ims)^{\|.*?^\|}|<table>.*?</table>'),
+            'hyperlink':    compileLinkR(),
+            'gallery':      re.compile(r'(?is)<gallery.*?>.*?</gallery>'),
+            # this matches internal wikilinks, but also interwiki, categories,
+            # and images.
+            'link':         re.compile(r'\[\[[^\]\|]*(\|[^\]]*)?\]\]'),
+            # Wikibase property inclusions
+            'property':     re.compile(r'(?i)\{\{\s*#property:\s*p\d+\s*\}\}'),
+            # Module invocations (currently only Lua)
+            'invoke':       re.compile(r'(?i)\{\{\s*#invoke:.*?}\}'),
+        })
+    if site not in _site_exception_regexes:
+        _site_exception_regexes[site] = {
+            # also finds links to foreign sites with preleading ":"
+            'interwiki':    re.compile(r'(?i)\[\[:?(%s)\s?:[^\]]*\]\][\s]*'
+                                       % '|'.join(site.validLanguageLinks() +
+                                                  list(site.family.obsolete.keys()))),
+            # categories
+            'category':     re.compile(u'\[\[ *(?:%s)\s*:.*?\]\]' % u'|'.join(site.namespace(14, all=True))),
+            # files
+            'file':         re.compile(u'\[\[ *(?:%s)\s*:.*?\]\]' % u'|'.join(site.namespace(6, all=True))),
+        }
+    regexes = dict(_exception_regexes)
+    regexes.update(_site_exception_regexes[site])
+    return regexes
+
+
 def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
                   allowoverlap=False, marker='', site=None):
     """
@@ -72,42 +131,6 @@ def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
     if site is None:
         site = pywikibot.Site()
 
-    exceptionRegexes = {
-        'comment':      re.compile(r'(?s)<!--.*?-->'),
-        # section headers
-        'header':       re.compile(r'\r?\n=+.+=+ *\r?\n'),
-        # preformatted text
-        'pre':          re.compile(r'(?ism)<pre>.*?</pre>'),
-        'source':       re.compile(r'(?is)<source .*?</source>'),
-        # inline references
-        'ref':          re.compile(r'(?ism)<ref[ >].*?</ref>'),
-        # lines that start with a space are shown in a monospace font and
-        # have whitespace preserved.
-        'startspace':   re.compile(r'(?m)^ (.*?)$'),
-        # tables often have whitespace that is used to improve wiki
-        # source code readability.
-        # TODO: handle nested tables.
-        'table':        re.compile(r'(?ims)^{\|.*?^\|}|<table>.*?</table>'),
-        'hyperlink':    compileLinkR(),
-        'gallery':      re.compile(r'(?is)<gallery.*?>.*?</gallery>'),
-        # this matches internal wikilinks, but also interwiki, categories, and
-        # images.
-        'link':         re.compile(r'\[\[[^\]\|]*(\|[^\]]*)?\]\]'),
-        # also finds links to foreign sites with preleading ":"
-        'interwiki':    re.compile(r'(?i)\[\[:?(%s)\s?:[^\]]*\]\][\s]*'
-                                   % '|'.join(site.validLanguageLinks() +
-                                              list(site.family.obsolete.keys()))),
-        # Wikibase property inclusions
-        'property':     re.compile(r'(?i)\{\{\s*#property:\s*p\d+\s*\}\}'),
-        # Module invocations (currently only Lua)
-        'invoke':       re.compile(r'(?i)\{\{\s*#invoke:.*?}\}'),
-        # categories
-        'category':     re.compile(u'\[\[ *(?:%s)\s*:.*?\]\]' % u'|'.join(site.namespace(14, all=True))),
-        # files
-        'file':         re.compile(u'\[\[ *(?:%s)\s*:.*?\]\]' % u'|'.join(site.namespace(6, all=True))),
-
-    }
-
     # if we got a string, compile it as a regular expression
     if isinstance(old, basestring):
         if caseInsensitive:
@@ -115,6 +138,42 @@ def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
         else:
             old = re.compile(old)
 
+    dontTouchRegexes, except_templates = _compile_exceptions(exceptions, site)
+
+    # mark templates
+    if except_templates:
+        text, Rmarker, restore = _mark_templates(text)
+        # hide the flat template marker
+        dontTouchRegexes.append(Rmarker)
+
+    if not callable(new):
+        # it is a little hack to make \n work. It would be better
+        # to fix it previously, but better than nothing.
+        new = new.replace('\\n', '\n')
+
+    result = None
+    if not allowoverlap:
+        result = _replace_outside(text, old, new, dontTouchRegexes, marker)
+    if result is not None:
+        text = result
+    else:
+        text = _replace_stepwise(text, old, new, dontTouchRegexes,
+                                 allowoverlap, marker)
+
+    if except_templates:  # restore templates from dict
+        text = restore(text)
+    return text
+
+
+def _compile_exceptions(exceptions, site):
+    """Return the regexes for the exceptions of replaceExcept().
+
+    @return: the list of exception regexes, and whether templates are
+        excepted
+    @rtype: tuple of list and bool
+
+    """
+    exceptionRegexes = _get_exception_regexes(site)
     dontTouchRegexes = []
     except_templates = False
     for exc in exceptions:
@@ -137,49 +196,104 @@ def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
         else:
             # assume it's a regular expression
             dontTouchRegexes.append(exc)
+    return dontTouchRegexes, except_templates
 
-    # mark templates
-    # don't care about mw variables and parser functions
-    if except_templates:
-        marker1 = findmarker(text)
-        marker2 = findmarker(text, u'##', u'#')
-        Rvalue = re.compile('{{{.+?}}}')
-        Rmarker1 = re.compile('%(mark)s(\d+)%(mark)s' % {'mark': marker1})
-        Rmarker2 = re.compile('%(mark)s(\d+)%(mark)s' % {'mark': marker2})
-        # hide the flat template marker
-        dontTouchRegexes.append(Rmarker1)
-        origin = text
-        values = {}
-        count = 0
-        for m in Rvalue.finditer(text):
+
+def _mark_templates(text):
+    """Replace the templates in text by markers.
+
+    Template parameters ({{{...}}}) are replaced by markers of their own.
+    Mediawiki variables and parser functions are treated like templates.
+
+    @return: the marked text, the regex which matches the template markers,
+        and a function which restores the templates in a marked text
+    @rtype: tuple
+
+    """
+    marker1 = findmarker(text)
+    marker2 = findmarker(text, u'##', u'#')
+    Rvalue = re.compile('{{{.+?}}}')
+    Rmarker1 = re.compile('%(mark)s(\d+)%(mark)s' % {'mark': marker1})
+    Rmarker2 = re.compile('%(mark)s(\d+)%(mark)s' % {'mark': marker2})
+    # If we have digits between brackets, restoring from dict may fail.
+    # So we need to change the index. We have to search in the origin.
+    reserved = set(re.findall(r'}}(\d+){{', text))
+    text, values = _hide_matches(text, Rvalue, marker2,
+                                 re.findall(r'}}}(\d+){{{', text))
+    templates = _find_templates(text, marker1)
+    inside = {}
+    parts = []
+    count = done = 0
+    # replace the outermost templates; they come in the order of the text
+    for template in templates:
+        if template.match is None or template.parent is not None \
+                and templates[template.parent].match is not None:
+            continue
+        count += 1
+        while unicode(count) in reserved:
             count += 1
-            # If we have digits between brackets, restoring from dict may fail.
-            # So we need to change the index. We have to search in the origin.
-            while u'}}}%d{{{' % count in origin:
-                count += 1
-            item = m.group()
-            text = text.replace(item, '%s%d%s' % (marker2, count, marker2))
-            values[count] = item
-        inside = {}
-        seen = set()
-        count = 0
-        while TEMP_REGEX.search(text) is not None:
-            for m in TEMP_REGEX.finditer(text):
-                item = m.group()
-                if item in seen:
-                    continue  # speed up
-                seen.add(item)
-                count += 1
-                while u'}}%d{{' % count in origin:
-                    count += 1
-                text = text.replace(item, '%s%d%s' % (marker1, count, marker1))
-
-                # Make sure stored templates don't contain markers
-                for m2 in Rmarker1.finditer(item):
-                    item = item.replace(m2.group(), inside[int(m2.group(1))])
-                for m2 in Rmarker2.finditer(item):
-                    item = item.replace(m2.group(), values[int(m2.group(1))])
-                inside[count] = item
+        parts.append(text[done:template.start])
+        parts.append('%s%d%s' % (marker1, count, marker1))
+        done = template.end
+        inside[count] = Rmarker2.sub(lambda m: values[int(m.group(1))],
+                                     text[template.start:template.end])
+    parts.append(text[done:])
+    text = text[:0].join(parts)
+
+    def restore(text):
+        text = Rmarker1.sub(lambda m: inside[int(m.group(1))], text)
+        return Rmarker2.sub(lambda m: values[int(m.group(1))], text)
+
+    return text, Rmarker1, restore
+
+
+def _expand(new, match):
+    """Return the replacement of match by new, as used by replaceExcept()."""
+    if callable(new):
+        # the parameter new can be a function which takes the match
+        # as a parameter.
+        return new(match)
+    # it is not a function, but a string.
+    if '\\' not in new:
+        # no group references
+        return new
+
+    # We cannot just insert the new string, as it may contain regex
+    # group references such as \2 or \g<name>.
+    # On the other hand, this approach does not work because it
+    # can't handle lookahead or lookbehind (see bug #1731008):
+    #
+    #  replacement = old.sub(new, text[match.start():match.end()])
+    #  text = text[:match.start()] + replacement + text[match.end():]
+
+    # So we have to process the group references manually.
+    replacement = new
+
+    groupR = re.compile(r'\\(?P<number>\d+)|\\g<(?P<name>.+?)>')
+    while True:
+        groupMatch = groupR.search(replacement)
+        if not groupMatch:
+            break
+        groupID = (groupMatch.group('name') or
+                   int(groupMatch.group('number')))
+        try:
+            replacement = (replacement[:groupMatch.start()] +
+                           ('' if match.group(groupID) is None else match.group(groupID)) + \
+                           replacement[groupMatch.end():])
+        except IndexError:
+            pywikibot.output('\nInvalid group reference: %s' % groupID)
+            pywikibot.output('Groups found:\n%s' % match.groups())
+            raise IndexError
+    return replacement
+
+
+def _replace_stepwise(text, old, new, exceptions, allowoverlap, marker):
+    """Replace old by new in text, except in matches of the exceptions.
+
+    After each replacement, the text is rebuilt and the search for the next
+    match of old and of every exception starts again.
+
+    """
     index = 0
     markerpos = len(text)
     while True:
@@ -190,7 +304,7 @@ def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
 
         # check which exception will occur next.
         nextExceptionMatch = None
-        for dontTouchR in dontTouchRegexes:
+        for dontTouchR in exceptions:
             excMatch = dontTouchR.search(text, index)
             if excMatch and (
                     nextExceptionMatch is None or
@@ -204,43 +318,7 @@ def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
             index = nextExceptionMatch.end()
         else:
             # We found a valid match. Replace it.
-            if callable(new):
-                # the parameter new can be a function which takes the match
-                # as a parameter.
-                replacement = new(match)
-            else:
-                # it is not a function, but a string.
-
-                # it is a little hack to make \n work. It would be better
-                # to fix it previously, but better than nothing.
-                new = new.replace('\\n', '\n')
-
-                # We cannot just insert the new string, as it may contain regex
-                # group references such as \2 or \g<name>.
-                # On the other hand, this approach does not work because it
-                # can't handle lookahead or lookbehind (see bug #1731008):
-                #
-                #  replacement = old.sub(new, text[match.start():match.end()])
-                #  text = text[:match.start()] + replacement + text[match.end():]
-
-                # So we have to process the group references manually.
-                replacement = new
-
-                groupR = re.compile(r'\\(?P<number>\d+)|\\g<(?P<name>.+?)>')
-                while True:
-                    groupMatch = groupR.search(replacement)
-                    if not groupMatch:
-                        break
-                    groupID = (groupMatch.group('name') or
-                               int(groupMatch.group('number')))
-                    try:
-                        replacement = (replacement[:groupMatch.start()] +
-                                       ('' if match.group(groupID) is None else match.group(groupID)) + \
-                                       replacement[groupMatch.end():])
-                    except IndexError:
-                        pywikibot.output('\nInvalid group reference: %s' % groupID)
-                        pywikibot.output('Groups found:\n%s' % match.groups())
-                        raise IndexError
+            replacement = _expand(new, match)
             text = text[:match.start()] + replacement + text[match.end():]
 
             # continue the search on the remaining text
@@ -249,14 +327,350 @@ def replaceExcept(text, old, new, exceptions, caseInsensitive=False,
             else:
                 index = match.start() + len(replacement)
             markerpos = match.start() + len(replacement)
-    text = text[:markerpos] + marker + text[markerpos:]
+    return text[:markerpos] + marker + text[markerpos:]
 
-    if except_templates:  # restore templates from dict
-        for m2 in Rmarker1.finditer(text):
-            text = text.replace(m2.group(), inside[int(m2.group(1))])
-        for m2 in Rmarker2.finditer(text):
-            text = text.replace(m2.group(), values[int(m2.group(1))])
-    return text
+
+def _replace_outside(text, old, new, exceptions, marker, searches=None):
+    """Replace old by new in text, except in matches of the exceptions.
+
+    This returns the same text as _replace_stepwise() without allowoverlap,
+    which searches the text with the preceding replacements made. As that
+    text is the original text from the search position on, the regexes can
+    as well search the original text, as long as the characters before the
+    search position which they may look at (e.g. for \\b or a lookbehind)
+    are equivalent; otherwise the rest of the text is copied behind the
+    last characters of the new text. So the next match of every exception
+    can be kept until the search has passed it, and each regex scans the
+    text about once. The new text is joined from its parts at the end.
+
+    If searches is a L{_SearchCache} of the exceptions for text, the
+    exceptions are searched through it as long as text is searched.
+
+    @return: the new text, which is text itself if nothing was replaced and
+        marker is empty; or None if a regex can't be analyzed
+
+    """
+    width = 0
+    exact = False
+    for regex in [old] + exceptions:
+        context = _context_width(regex)
+        if context is None:
+            return None
+        width = max(width, context[0])
+        exact = exact or context[1]
+
+    src = text
+    # parts of the new text, which ends with src[done:pos]
+    parts = []
+    done = pos = 0
+    markerpos = None
+    # the next match of old and of each exception at or after the search
+    # position, None if there is no more match, False if not yet searched
+    match = False
+    nextMatches = [False] * len(exceptions)
+    while True:
+        if match is False or match is not None and match.start() < pos:
+            match = old.search(src, pos)
+        if match is None:
+            break
+
+        # check which exception will occur next.
+        nextExceptionMatch = None
+        for i, dontTouchR in enumerate(exceptions):
+            excMatch = nextMatches[i]
+            if excMatch is False \
+                    or excMatch is not None and excMatch.start() < pos:
+                if searches is not None and src is searches.text:
+                    excMatch = searches.search(i, pos)
+                else:
+                    excMatch = dontTouchR.search(src, pos)
+                nextMatches[i] = excMatch
+            if excMatch and (
+                    nextExceptionMatch is None or
+                    excMatch.start() < nextExceptionMatch.start()):
+                nextExceptionMatch = excMatch
+
+        if nextExceptionMatch is not None \
+                and nextExceptionMatch.start() <= match.start():
+            # Skip the exception.
+            pos = nextExceptionMatch.end()
+            continue
+
+        parts.append(src[done:match.start()])
+        parts.append(_expand(new, match))
+        markerpos = len(parts)
+        done = pos = match.end()
+        if width:
+            # the last characters of the new text
+            tail = text[:0]
+            for part in reversed(parts):
+                tail = part + tail
+                if len(tail) >= width:
+                    break
+            tail = tail[-width:]
+            if exact:
+                same = tail == src[max(0, pos - width):pos]
+            else:
+                same = _char_class(tail[-1:]) == _char_class(src[pos - 1:pos])
+            if not same:
+                src = tail + src[pos:]
+                done = pos = len(tail)
+                match = False
+                nextMatches = [False] * len(exceptions)
+    if markerpos is None and not marker:
+        return text
+    parts.append(src[done:])
+    if markerpos is None:
+        parts.append(marker)
+    else:
+        parts.insert(markerpos, marker)
+    return text[:0].join(parts)
+
+
+# characters which regexes may read before their start position, by pattern
+_context_widths = {}
+
+
+def _context_width(regex):
+    """Return how many characters before its search position regex may read.
+
+    @return: the number of characters, and whether the characters matter
+        or only whether the last one is a word character or a newline;
+        None if the pattern can't be analyzed
+    @rtype: tuple of int and bool
+
+    """
+    key = (regex.pattern, regex.flags)
+    if key not in _context_widths:
+        try:
+            parsed = sre_parse.parse(regex.pattern, regex.flags)
+            width, exact = _subpattern_context(parsed)
+        except Exception:
+            _context_widths[key] = None
+        else:
+            if width and regex.flags & re.LOCALE:
+                exact = True
+            _context_widths[key] = (width, exact)
+    return _context_widths[key]
+
+
+def _subpattern_context(subpattern):
+    """Return the context of a parsed pattern; see _context_width()."""
+    width = 0
+    exact = False
+    for op, av in subpattern:
+        if op == sre_constants.AT:
+            if av not in (sre_constants.AT_END, sre_constants.AT_END_LINE,
+                          sre_constants.AT_END_STRING):
+                width = max(width, 1)
+            continue
+        children = []
+        stack = [av]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, sre_parse.SubPattern):
+                children.append(item)
+            elif isinstance(item, (tuple, list)):
+                stack.extend(item)
+        for child in children:
+            childwidth, childexact = _subpattern_context(child)
+            if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT) \
+                    and av[0] < 0:
+                # lookbehind
+                childwidth += child.getwidth()[1]
+                childexact = True
+            width = max(width, childwidth)
+            exact = exact or childexact
+    return width, exact
+
+
+def _char_class(char):
+    """Return what \\b and ^ can tell about the character before a position."""
+    if not char:
+        return None
+    word = char.isalnum() or char == u'_'
+    return (char == u'\n', word, word and ord(char) < 128)
+
+
+class _SearchCache(object):
+
+    """The matches of several regexes in a text, searched from any position.
+
+    A search from a position finds the same match as a search from any
+    position up to the start of that match, so the matches found are kept
+    together with the position they were searched from.
+
+    """
+
+    def __init__(self, text, regexes):
+        self.text = text
+        self.regexes = regexes
+        self._positions = [[] for regex in regexes]
+        self._matches = [[] for regex in regexes]
+
+    def search(self, i, pos):
+        """Return the result of regexes[i].search(text, pos)."""
+        positions = self._positions[i]
+        matches = self._matches[i]
+        k = bisect.bisect_right(positions, pos)
+        if k:
+            match = matches[k - 1]
+            if match is None or pos <= match.start():
+                return match
+        match = self.regexes[i].search(self.text, pos)
+        positions.insert(k, pos)
+        matches.insert(k, match)
+        return match
+
+
+class ReplacementProgram(object):
+
+    """The replacements of a fix, compiled to be applied to many texts.
+
+    A fix is a dictionary like those in L{pywikibot.fixes}, with the keys
+    'replacements', 'exceptions', 'regex' and 'nocase'. L{replace} returns
+    the same text as calling L{replaceExcept} for one replacement after the
+    other with the 'inside-tags' and 'inside' exceptions, but the regexes
+    are compiled once, the exceptions are searched once for all
+    replacements until one of them changes the text, and a replacement
+    which doesn't occur doesn't copy the text.
+
+    """
+
+    def __init__(self, fix, site=None, allowoverlap=False):
+        """Constructor.
+
+        @param fix: a fix, or the name of a fix in L{pywikibot.fixes}
+        @type fix: dict or basestring
+        @param site: the site of the texts; the default site if None
+        @type site: BaseSite
+        @param allowoverlap: whether overlapping occurrences are all replaced,
+            see L{replaceExcept}
+        @type allowoverlap: bool
+
+        """
+        if isinstance(fix, basestring):
+            from pywikibot import fixes
+            fix = fixes.fixes[fix]
+        if site is None:
+            site = pywikibot.Site()
+        self.site = site
+        self.allowoverlap = allowoverlap
+
+        regex = fix.get('regex', False)
+        flags = re.UNICODE
+        if fix.get('nocase', False):
+            flags |= re.IGNORECASE
+
+        self.replacements = []
+        for old, new in fix['replacements']:
+            if isinstance(old, basestring):
+                if not regex:
+                    old = re.escape(old)
+                old = re.compile(old, flags)
+            if not callable(new):
+                # the same hack as in replaceExcept()
+                new = new.replace('\\n', '\n')
+            self.replacements.append((old, new))
+
+        exceptions = fix.get('exceptions', {})
+        self.exceptions = {}
+        for category in ('title', 'require-title', 'text-contains', 'inside'):
+            patterns = []
+            for pattern in exceptions.get(category, []):
+                if isinstance(pattern, basestring):
+                    if not regex:
+                        pattern = re.escape(pattern)
+                    pattern = re.compile(pattern, flags)
+                patterns.append(pattern)
+            self.exceptions[category] = patterns
+        self.regexes, self.except_templates = _compile_exceptions(
+            list(exceptions.get('inside-tags', [])) +
+            self.exceptions['inside'], site)
+
+    def is_title_excepted(self, title):
+        """Return whether the fix must not be applied to a page title."""
+        for exc in self.exceptions['title']:
+            if exc.search(title):
+                return True
+        for req in self.exceptions['require-title']:
+            if not req.search(title):
+                return True
+        return False
+
+    def is_text_excepted(self, text):
+        """Return whether the fix must not be applied to a page text."""
+        for exc in self.exceptions['text-contains']:
+            if exc.search(text):
+                return True
+        return False
+
+    def replace(self, text):
+        """Return text with all replacements of the fix applied."""
+        # the text searched, with templates marked if they are excepted;
+        # None after a replacement changed the text
+        marked = None
+        for old, new in self.replacements:
+            if marked is None:
+                if self.except_templates:
+                    marked, Rmarker, restore = _mark_templates(text)
+                    regexes = self.regexes + [Rmarker]
+                else:
+                    marked, regexes = text, self.regexes
+                searches = _SearchCache(marked, regexes)
+            result = None
+            if not self.allowoverlap:
+                result = _replace_outside(marked, old, new, regexes, '',
+                                          searches)
+            if result is None:
+                result = _replace_stepwise(marked, old, new, regexes,
+                                           self.allowoverlap, '')
+            if result is not marked and result != marked:
+                if self.except_templates:
+                    result = restore(result)
+                text = result
+                marked = None
+        return text
+
+
+# parts of the text where wiki markup is disabled, by their opening and
+# closing tags
+_disabled_parts = {
+    'comments':        ('<!--', '-->'),
+    'includeonly':     ('<includeonly>', '</includeonly>'),
+    'nowiki':          ('<nowiki>', '</nowiki>'),
+    'pre':             ('<pre>', '</pre>'),
+    'source':          ('<source ', '</source>'),
+    'syntaxhighlight': ('<syntaxhighlight ', '</syntaxhighlight>'),
+}
+# regexes matching disabled parts, by set of tags
+_disabled_parts_regexes = {}
+
+
+def _get_disabled_parts_regex(tags):
+    """Return the regex which matches the disabled parts given by tags.
+
+    The group of each match is named after its tag. For the tags parameter,
+    see removeDisabledParts().
+
+    """
+    key = frozenset(tags)
+    if key not in _disabled_parts_regexes:
+        if '*' in key:
+            tags = set(_disabled_parts)
+        else:
+            tags = set(key)
+        # add alias
+        if 'source' in tags:
+            tags.add('syntaxhighlight')
+        parts = []
+        for tag in tags:
+            opening, closing = _disabled_parts[tag]
+            parts.append('(?P<%s>%s.*?%s)'
+                         % (tag, re.escape(opening), re.escape(closing)))
+        _disabled_parts_regexes[key] = re.compile('|'.join(parts),
+                                                  re.IGNORECASE | re.DOTALL)
+    return _disabled_parts_regexes[key]
 
 
 def removeDisabledParts(text, tags=['*']):
@@ -272,24 +686,16 @@ def removeDisabledParts(text, tags=['*']):
     The exact set of parts which should be removed can be passed as the
     'parts' parameter, which defaults to all.
 
+    text may also be a Page; its parsed text (see L{ParsedText}) keeps the
+    result until the text of the page changes.
+
     """
-    regexes = {
-        'comments':        r'<!--.*?-->',
-        'includeonly':     r'<includeonly>.*?</includeonly>',
-        'nowiki':          r'<nowiki>.*?</nowiki>',
-        'pre':             r'<pre>.*?</pre>',
-        'source':          r'<source .*?</source>',
-        'syntaxhighlight': r'<syntaxhighlight .*?</syntaxhighlight>',
-    }
-    if '*' in tags:
-        tags = list(regexes.keys())
-    # add alias
-    tags = set(tags)
-    if 'source' in tags:
-        tags.add('syntaxhighlight')
-    toRemoveR = re.compile('|'.join([regexes[tag] for tag in tags]),
-                           re.IGNORECASE | re.DOTALL)
-    return toRemoveR.sub('', text)
+    if isinstance(text, pywikibot.Page):
+        parsed = text.parsed_text
+        if '*' in tags:
+            return parsed._parse(ParsedText._enabled_text)
+        return parsed.result(removeDisabledParts, frozenset(tags))
+    return _get_disabled_parts_regex(tags).sub('', text)
 
 
 def removeHTMLParts(text, keeptags=['tt', 'nowiki', 'small', 'sup']):
@@ -334,12 +740,140 @@ def isDisabled(text, index, tags=['*']):
     Return True if text[index] is disabled, e.g. by a comment or by nowiki tags.
     For the tags parameter, see removeDisabledParts() above.
 
+    The disabled parts of the last text object are kept (see
+    L{DisabledSpans}), so that asking about several indexes of the same
+    text is fast. text may also be a Page; its parsed text (see
+    L{ParsedText}) keeps them until the text of the page changes.
+
     """
-    # Find a marker that is not already in the text.
-    marker = findmarker(text)
-    text = text[:index] + marker + text[index:]
-    text = removeDisabledParts(text, tags)
-    return (marker not in text)
+    global _last_disabled_spans
+    if isinstance(text, pywikibot.Page):
+        spans = text.parsed_text.result(DisabledSpans, frozenset(tags))
+    else:
+        tags = frozenset(tags)
+        # a single tuple is read and replaced at once, which is thread-safe
+        last_text, last_tags, spans = _last_disabled_spans
+        if text is not last_text or tags != last_tags:
+            spans = DisabledSpans(text, tags)
+            _last_disabled_spans = (text, tags, spans)
+    return spans.is_disabled(index)
+
+
+# the last text given to isDisabled(), its tags and its DisabledSpans
+_last_disabled_spans = (None, None, None)
+
+
+class DisabledSpans(object):
+
+    """The parts of a text where wiki markup is disabled.
+
+    The parts and the positions of their tags are found once, and
+    is_disabled() looks an index up by binary search.
+
+    """
+
+    def __init__(self, text, tags=['*']):
+        """Constructor.
+
+        @param text: the wikitext
+        @type text: unicode
+        @param tags: the parts which are disabled, see removeDisabledParts()
+        @type tags: list of str
+
+        """
+        self.text = text
+        self.tags = tags
+        regex = _get_disabled_parts_regex(tags)
+        # the spans of the disabled parts, the spans of their contents and
+        # their tags
+        self.spans = []
+        self._starts = []
+        self._contents = []
+        self._tags = []
+        for m in regex.finditer(text):
+            opening, closing = _disabled_parts[m.lastgroup]
+            self.spans.append(m.span())
+            self._starts.append(m.start())
+            self._contents.append((m.start() + len(opening),
+                                   m.end() - len(closing)))
+            self._tags.append(m.lastgroup)
+        # the positions of all opening tags with their tags, and of the
+        # closing tags by tag; no tag can overlap another one of its kind
+        openings = []
+        self._closings = {}
+        for tag in regex.groupindex:
+            opening, closing = _disabled_parts[tag]
+            openings.extend((m.start(), tag) for m in re.finditer(
+                re.escape(opening), text, re.IGNORECASE))
+            self._closings[tag] = [m.start() for m in re.finditer(
+                re.escape(closing), text, re.IGNORECASE)]
+        openings.sort()
+        self._openings = [start for start, tag in openings]
+        self._opening_tags = [tag for start, tag in openings]
+        # is_disabled() of the indexes which break the last closing tag of
+        # its kind, where the text after the opening tag is searched again
+        self._rescanned = {}
+        for (start, end), (_, closing), tag in zip(self.spans,
+                                                   self._contents, self._tags):
+            if self._closings[tag][-1] == closing:
+                for index in range(closing + 1, end):
+                    self._rescanned[index] = self._covered(start + 1, index)
+
+    def _covered(self, pos, index):
+        """Return True if a part found from pos contains a marker at index.
+
+        The parts are searched like by removeDisabledParts(), in the text
+        with a marker inserted at index, which breaks the tag it is in.
+
+        """
+        while True:
+            i = bisect.bisect_left(self._openings, pos)
+            if i == len(self._openings) or self._openings[i] >= index:
+                return False
+            start = self._openings[i]
+            opening, closing = _disabled_parts[self._opening_tags[i]]
+            pos = start + 1
+            if index < start + len(opening):
+                continue
+            closings = self._closings[self._opening_tags[i]]
+            j = bisect.bisect_left(closings, start + len(opening))
+            if j < len(closings) and closings[j] < index:
+                if index < closings[j] + len(closing):
+                    j += 1
+                else:
+                    # the part ends before the marker
+                    pos = closings[j] + len(closing)
+                    continue
+            if j < len(closings):
+                return True
+
+    def is_disabled(self, index):
+        """Return True if text[index] is disabled.
+
+        This returns the same as isDisabled(), which inserts a marker at
+        index and checks whether removeDisabledParts() removes it. This
+        only differs from whether index is in a disabled part where the
+        marker breaks an opening or closing tag.
+
+        @param index: the index in the text
+        @type index: int
+        @rtype: bool
+
+        """
+        i = bisect.bisect_right(self._starts, index) - 1
+        if i < 0 or index >= self.spans[i][1]:
+            return False
+        if self._contents[i][0] <= index <= self._contents[i][1]:
+            return True
+        if index < self._contents[i][0]:
+            # The opening tag is broken or follows the marker, and nothing
+            # else can start before the marker.
+            return False
+        # The closing tag is broken, and the part extends to the next one.
+        closings = self._closings[self._tags[i]]
+        if bisect.bisect_left(closings, index) < len(closings):
+            return True
+        return self._rescanned[index]
 
 
 def findmarker(text, startwith=u'@@', append=None):
@@ -397,6 +931,17 @@ def expandmarker(text, marker='', separator=''):
 #        do not find or change links of other kinds, nor any that are formatted
 #        as in-line interwiki links (e.g., "[[:es:Articulo]]".
 
+# This regular expression will find every link that is possibly an
+# interwiki link.
+# NOTE: language codes are case-insensitive and only consist of basic latin
+# letters and hyphens.
+# TODO: currently, we do not have any, but BCP 47 allows digits, and
+#       underscores.
+# TODO: There is no semantic difference between hyphens and
+#       underscores -> fold them.
+_language_link_regex = re.compile(r'\[\[([a-zA-Z\-]+)\s?:([^\[\]\n]*)\]\]')
+
+
 def getLanguageLinks(text, insite=None, pageLink="[[]]",
                      template_subpage=False):
     """
@@ -407,7 +952,19 @@ def getLanguageLinks(text, insite=None, pageLink="[[]]",
     Do not call this routine directly, use Page.interwiki() method
     instead.
 
+    text may also be a Page, whose site is the default of insite; its parsed
+    text (see L{ParsedText}) keeps the result until the text of the page
+    changes.
+
     """
+    if isinstance(text, pywikibot.Page):
+        if insite is None:
+            insite = text.site
+        links = text.parsed_text.result(getLanguageLinks, insite, pageLink,
+                                        template_subpage)
+        # new Page objects, as the callers may change them
+        return dict((site, pywikibot.Page(page._link))
+                    for site, page in links.items())
     if insite is None:
         insite = pywikibot.Site()
     fam = insite.family
@@ -423,22 +980,13 @@ def getLanguageLinks(text, insite=None, pageLink="[[]]",
         tags += ['includeonly']
     text = removeDisabledParts(text, tags)
 
-    # This regular expression will find every link that is possibly an
-    # interwiki link.
-    # NOTE: language codes are case-insensitive and only consist of basic latin
-    # letters and hyphens.
-    # TODO: currently, we do not have any, but BCP 47 allows digits, and
-    #       underscores.
-    # TODO: There is no semantic difference between hyphens and
-    #       underscores -> fold them.
-    interwikiR = re.compile(r'\[\[([a-zA-Z\-]+)\s?:([^\[\]\n]*)\]\]')
-    for lang, pagetitle in interwikiR.findall(text):
+    for lang, pagetitle in _language_link_regex.findall(text):
         lang = lang.lower()
         # Check if it really is in fact an interwiki link to a known
         # language, or if it's e.g. a category tag or an internal link
         if lang in fam.obsolete:
             lang = fam.obsolete[lang]
-        if lang in list(fam.langs.keys()):
+        if lang in fam.langs:
             if '|' in pagetitle:
                 # ignore text after the pipe
                 pagetitle = pagetitle[:pagetitle.index('|')]
@@ -648,24 +1196,38 @@ def interwikiSort(sites, insite=None):
 # Functions dealing with category links
 # -------------------------------------
 
+def _category_link_regex(site):
+    """Return the regex which finds the category links of site."""
+    catNamespace = '|'.join(site.category_namespaces())
+    return re.compile(r'\[\[\s*(?P<namespace>%s)\s*:\s*(?P<catName>.+?)'
+                      r'(?:\|(?P<sortKey>.*?))?\]\]'
+                      % catNamespace, re.I)
+
+
 def getCategoryLinks(text, site=None):
     """Return a list of category links found in text.
 
+    text may also be a Page, whose site is the default of site; its parsed
+    text (see L{ParsedText}) keeps the links found until the text of the
+    page changes.
+
     @return: all category links found
     @returntype: list of Category objects
 
     """
+    if isinstance(text, pywikibot.Page):
+        if site is None:
+            site = text.site
+        matches = text.parsed_text._parse(ParsedText._category_matches, site)
+    else:
+        if site is None:
+            site = pywikibot.Site()
+        # Ignore category links within nowiki tags, pre tags, includeonly
+        # tags, and HTML comments
+        matches = _category_link_regex(site).finditer(
+            removeDisabledParts(text))
     result = []
-    if site is None:
-        site = pywikibot.Site()
-    # Ignore category links within nowiki tags, pre tags, includeonly tags,
-    # and HTML comments
-    text = removeDisabledParts(text)
-    catNamespace = '|'.join(site.category_namespaces())
-    R = re.compile(r'\[\[\s*(?P<namespace>%s)\s*:\s*(?P<catName>.+?)'
-                   r'(?:\|(?P<sortKey>.*?))?\]\]'
-                   % catNamespace, re.I)
-    for match in R.finditer(text):
+    for match in matches:
         cat = pywikibot.Category(pywikibot.Link(
                                  '%s:%s' % (match.group('namespace'),
                                             match.group('catName')),
@@ -910,16 +1472,20 @@ def extract_templates_and_params(text):
     only the last value provided will be returned.
 
     This uses a third party library (mwparserfromhell) if it is installed
-    and enabled in the user-config.py. Otherwise it falls back on a
-    regex based function defined below.
+    and enabled in the user-config.py. Otherwise it falls back on
+    extract_templates_and_params_tokenized() defined below.
 
-    @param text: The wikitext from which templates are extracted
-    @type text: unicode or string
+    @param text: The wikitext from which templates are extracted; or a
+        Page, whose parsed text (see L{ParsedText}) keeps the result until
+        the text of the page changes
+    @type text: unicode or string or Page
 
     """
-
+    if isinstance(text, pywikibot.Page):
+        return [(name, dict(params)) for name, params
+                in text.parsed_text.result(extract_templates_and_params)]
     if not (config.use_mwparserfromhell and mwparserfromhell):
-        return extract_templates_and_params_regex(text)
+        return extract_templates_and_params_tokenized(text)
     code = mwparserfromhell.parse(text)
     result = []
     for template in code.filter_templates(recursive=True):
@@ -1088,6 +1654,426 @@ def extract_templates_and_params_regex(text):
     return result
 
 
+def extract_templates_and_params_tokenized(text):
+    """
+    See the documentation for extract_templates_and_params
+    This returns the same as extract_templates_and_params_regex, but finds
+    the templates in a single pass over the text instead of replacing the
+    innermost templates by markers until there are no more templates; and
+    an empty last parameter as in {{foo|}} is recognized, while a stray
+    closing brace as in {{}}} is not taken as the name of a template. The
+    differences are listed in tests/textlib_tests.py.
+    @param text: The wikitext from which templates are extracted
+    @type text: unicode or string
+    @return: list of tuples of template name and dict of parameters
+    """
+
+    # remove commented-out stuff etc.
+    thistxt = removeDisabledParts(text)
+
+    # marker for inside templates or parameters
+    marker1 = findmarker(thistxt)
+
+    # marker for links
+    marker2 = findmarker(thistxt, u'##', u'#')
+
+    # marker for math
+    marker3 = findmarker(thistxt, u'%%', u'%')
+
+    # marker for value parameter
+    marker4 = findmarker(thistxt, u'§§', u'§')
+
+    result = []
+    Rmath = re.compile(r'<math>[^<]+</math>')
+    Rvalue = re.compile(r'{{{.+?}}}')
+    Rmarker1 = re.compile(r'%s(\d+)%s' % (marker1, marker1))
+    Rmarker2 = re.compile(r'%s(\d+)%s' % (marker2, marker2))
+    Rmarker3 = re.compile(r'%s(\d+)%s' % (marker3, marker3))
+    Rmarker4 = re.compile(r'%s(\d+)%s' % (marker4, marker4))
+
+    # Replace math and value parameters with markers
+    thistxt, maths = _hide_matches(thistxt, Rmath, marker3)
+    thistxt, values = _hide_matches(thistxt, Rvalue, marker4,
+                                    re.findall(r'}}}(\d+){{{', text))
+
+    templates = _find_templates(thistxt, marker1)
+
+    # templates without markers, by their index
+    inside = {}
+    for index, template in enumerate(templates):
+        if template.match is None:
+            continue
+        item = Rmarker1.sub(lambda m: inside[int(m.group(1))],
+                            template.collapsed)
+        item = Rmarker3.sub(lambda m: maths[int(m.group(1))], item)
+        item = Rmarker4.sub(lambda m: values[int(m.group(1))], item)
+        inside[index] = item
+
+    # The innermost templates come first, as they are found first when
+    # replacing them by markers, and equal templates are returned once.
+    order = sorted((template.height, template.start, index)
+                   for index, template in enumerate(templates)
+                   if template.match is not None)
+    seen = set()
+    for height, start, index in order:
+        if inside[index] in seen:
+            continue
+        seen.add(inside[index])
+        m = templates[index].match
+
+        # Name
+        name = m.group('name').strip()
+        m2 = Rmarker1.search(name) or Rmath.search(name)
+        if m2 is not None:
+            # Doesn't detect templates whose name changes,
+            # or templates whose name contains math tags
+            continue
+
+        # {{#if: }}
+        if not name or name.startswith('#'):
+            continue
+
+        # Parameters
+        paramString = m.group('params')
+        params = {}
+        numbered_param = 1
+        if paramString is not None:
+            # Replace wikilinks with markers
+            links = {}
+            count2 = 0
+            for m2 in pywikibot.link_regex.finditer(paramString):
+                count2 += 1
+                item = m2.group(0)
+                paramString = paramString.replace(
+                    item, '%s%d%s' % (marker2, count2, marker2))
+                links[count2] = item
+            # Parse string
+            markedParams = paramString.split('|')
+            # Replace markers
+            for param in markedParams:
+                if "=" in param:
+                    param_name, param_val = param.split("=", 1)
+                else:
+                    param_name = unicode(numbered_param)
+                    param_val = param
+                    numbered_param += 1
+                param_val = Rmarker1.sub(
+                    lambda m2: inside[int(m2.group(1))], param_val)
+                param_val = Rmarker2.sub(
+                    lambda m2: links[int(m2.group(1))], param_val)
+                param_val = Rmarker3.sub(
+                    lambda m2: maths[int(m2.group(1))], param_val)
+                param_val = Rmarker4.sub(
+                    lambda m2: values[int(m2.group(1))], param_val)
+                params[param_name.strip()] = param_val.strip()
+
+        # Add it to the result
+        result.append((name, params))
+    return result
+
+
+def _hide_matches(text, regex, marker, reserved=()):
+    """Replace the matches of regex in text by numbered markers.
+
+    Equal matches get the same number. Numbers in reserved (as strings)
+    are skipped.
+
+    @return: the new text and a dict of the matches by their numbers
+    @rtype: tuple of unicode and dict
+
+    """
+    reserved = set(reserved)
+    numbers = {}
+    matches = {}
+    # the last number used
+    count = [0]
+
+    def hide(match):
+        item = match.group()
+        if item not in numbers:
+            count[0] += 1
+            while unicode(count[0]) in reserved:
+                count[0] += 1
+            numbers[item] = count[0]
+            matches[count[0]] = item
+        return '%s%d%s' % (marker, numbers[item], marker)
+
+    return regex.sub(hide, text), matches
+
+
+class _Template(object):
+
+    """A template found by _find_templates()."""
+
+    def __init__(self, start, end, height, collapsed, match):
+        self.start = start
+        self.end = end
+        self.height = height
+        # the template text with the nested templates replaced by markers
+        self.collapsed = collapsed
+        # the match of _TEMPLATE_REGEX on collapsed, None if it's no template
+        self.match = match
+        # the index of the template this one is nested in
+        self.parent = None
+
+
+# a run of opening or closing braces
+_BRACES_REGEX = re.compile(r'{+|}+')
+# TEMP_REGEX, but the parameters may be empty like in {{foo|}}
+_TEMPLATE_REGEX = re.compile(
+    '{{(?:msg:)?(?P<name>[^{\|]+?)'
+    '(?:\|(?P<params>(?:[^{]+?(?:{[^{]+?}[^{]*?)?)?))?}}$')
+
+
+def _find_templates(text, marker):
+    """Return the templates in text.
+
+    The braces are paired with a stack in a single pass over text, which
+    must not contain template parameters ({{{...}}}). Like replacing the
+    innermost templates with markers until TEMP_REGEX doesn't match any
+    more, a pair of double braces is a template if its text, with the
+    nested templates replaced by markers, matches TEMP_REGEX; a template
+    nested in something which isn't a template is found nevertheless.
+    Unlike TEMP_REGEX, an empty last parameter is allowed, and so a
+    template never extends beyond its closing braces.
+
+    @param marker: the marker of nested templates, which are replaced by
+        marker + their index in the returned list + marker
+    @return: the pairs of double braces in the order of their ends, with
+        a match of None if they are no template
+    @rtype: list of _Template
+
+    """
+    templates = []
+    # open braces as lists of width, position and indexes of nested templates
+    stack = []
+    for m in _BRACES_REGEX.finditer(text):
+        pos = m.start()
+        count = len(m.group())
+        if m.group()[0] == '{':
+            # the last two braces of an odd number of braces open a template
+            if count % 2:
+                stack.append([1, pos, []])
+                pos += 1
+                count -= 1
+            while count:
+                stack.append([2, pos, []])
+                pos += 2
+                count -= 2
+            continue
+        while stack and count >= stack[-1][0]:
+            width, start, nested = stack.pop()
+            pos += width
+            count -= width
+            if width == 1:
+                # templates within single braces belong to the enclosing ones
+                if stack:
+                    stack[-1][2].extend(nested)
+                continue
+            height = 1
+            parts = []
+            done = start
+            match = None
+            for index in nested:
+                template = templates[index]
+                if template.match is None:
+                    break
+                height = max(height, template.height + 1)
+                parts.append(text[done:template.start])
+                parts.append('%s%d%s' % (marker, index, marker))
+                done = template.end
+            else:
+                parts.append(text[done:pos])
+                collapsed = text[:0].join(parts)
+                match = _TEMPLATE_REGEX.match(collapsed)
+            if match is None:
+                collapsed = None
+            templates.append(_Template(start, pos, height, collapsed, match))
+            for index in nested:
+                templates[index].parent = len(templates) - 1
+            if stack:
+                stack[-1][2].append(len(templates) - 1)
+    return templates
+
+
+class ParsedText(object):
+
+    """The markup of a wikitext, parsed when it is first needed.
+
+    The spans of the markup are lists of (start, end) tuples of positions in
+    text, in the order of the text. Markup within disabled parts (see
+    removeDisabledParts) is ignored, like by the textlib functions.
+
+    L{pywikibot.Page.parsed_text} keeps an instance for the current text of
+    a page. When removeDisabledParts, isDisabled, getLanguageLinks,
+    getCategoryLinks and extract_templates_and_params are given the page
+    instead of its text, they take their result from there, so that it is
+    computed once for each text. They return new lists, dicts and Page
+    objects, so that callers may change them.
+
+    """
+
+    def __init__(self, text, site=None):
+        """Constructor.
+
+        @param text: the wikitext
+        @type text: unicode
+        @param site: the site of the text, which finds the category links
+            and the language links; the default site if None
+        @type site: BaseSite
+
+        """
+        self.text = text
+        self.site = site
+        self._results = {}
+
+    def result(self, function, *args):
+        """Return function(text, *args), computing it only once.
+
+        @param function: a function taking the text as its first argument;
+            its result is shared by all callers and must not be changed
+        """
+        key = (function,) + args
+        if key not in self._results:
+            self._results[key] = function(self.text, *args)
+        return self._results[key]
+
+    def _parse(self, method, *args):
+        """Return method(self, *args), computing it only once."""
+        key = (method,) + args
+        if key not in self._results:
+            self._results[key] = method(self, *args)
+        return self._results[key]
+
+    def _get_site(self):
+        if self.site is None:
+            self.site = pywikibot.Site()
+        return self.site
+
+    def _disabled_spans(self, tag=None):
+        spans = self.result(DisabledSpans, frozenset(['*']))
+        return [span for span, name in zip(spans.spans, spans._tags)
+                if tag is None or name == tag]
+
+    @property
+    def disabled(self):
+        """The spans of all parts where wiki markup is disabled."""
+        return list(self._parse(ParsedText._disabled_spans))
+
+    @property
+    def comments(self):
+        """The spans of HTML comments."""
+        return list(self._parse(ParsedText._disabled_spans, 'comments'))
+
+    @property
+    def nowiki(self):
+        """The spans of nowiki tags."""
+        return list(self._parse(ParsedText._disabled_spans, 'nowiki'))
+
+    def _enabled_text(self):
+        """Return the text without its disabled parts.
+
+        This is what removeDisabledParts() returns for the text.
+
+        """
+        parts = []
+        done = 0
+        for start, end in self._parse(ParsedText._disabled_spans):
+            parts.append(self.text[done:start])
+            done = end
+        parts.append(self.text[done:])
+        return self.text[:0].join(parts)
+
+    def _removed(self):
+        """Return where the disabled parts were removed from the text.
+
+        These are two lists: the positions in the enabled text, and the
+        number of characters removed up to each of them.
+
+        """
+        positions = []
+        removed = []
+        count = 0
+        for start, end in self._parse(ParsedText._disabled_spans):
+            positions.append(start - count)
+            count += end - start
+            removed.append(count)
+        return positions, removed
+
+    def _original_span(self, start, end):
+        """Return the span in text of a span in the enabled text."""
+        positions, removed = self._parse(ParsedText._removed)
+        # the parts removed before the first character, and before the end
+        i = bisect.bisect_right(positions, start)
+        j = bisect.bisect_left(positions, end)
+        return (start + (removed[i - 1] if i else 0),
+                end + (removed[j - 1] if j else 0))
+
+    def _original_spans(self, matches):
+        return [self._original_span(*m.span()) for m in matches]
+
+    def _template_spans(self):
+        # template parameters and math are hidden, as the templates are
+        # found like by extract_templates_and_params
+        text = self._parse(ParsedText._enabled_text)
+        parts = []
+        done = 0
+        for m in re.finditer(r'<math>[^<]+</math>|{{{.+?}}}', text):
+            parts.append(text[done:m.start()])
+            parts.append(u' ' * (m.end() - m.start()))
+            done = m.end()
+        parts.append(text[done:])
+        text = text[:0].join(parts)
+        return sorted(self._original_span(template.start, template.end)
+                      for template in _find_templates(text, u'@')
+                      if template.match is not None)
+
+    @property
+    def templates(self):
+        """The spans of templates, including nested ones."""
+        return list(self._parse(ParsedText._template_spans))
+
+    def _link_spans(self):
+        return self._original_spans(pywikibot.link_regex.finditer(
+            self._parse(ParsedText._enabled_text)))
+
+    @property
+    def links(self):
+        """The spans of all wikilinks, including categories and interwikis."""
+        return list(self._parse(ParsedText._link_spans))
+
+    def _category_matches(self, site):
+        """Return the matches of the category links of site."""
+        return list(_category_link_regex(site).finditer(
+            self._parse(ParsedText._enabled_text)))
+
+    def _category_spans(self):
+        return self._original_spans(
+            self._parse(ParsedText._category_matches, self._get_site()))
+
+    @property
+    def categories(self):
+        """The spans of category links."""
+        return list(self._parse(ParsedText._category_spans))
+
+    def _language_link_spans(self):
+        fam = self._get_site().family
+        if fam.interwiki_forward:
+            fam = pywikibot.site.Family(fam.interwiki_forward)
+        matches = []
+        for m in _language_link_regex.finditer(
+                self._parse(ParsedText._enabled_text)):
+            lang = m.group(1).lower()
+            if lang in fam.langs or fam.obsolete.get(lang) in fam.langs:
+                matches.append(m)
+        return self._original_spans(matches)
+
+    @property
+    def interwikis(self):
+        """The spans of inter-language links."""
+        return list(self._parse(ParsedText._language_link_spans))
+
+
 def glue_template_and_params(template_and_params):
     """Return wiki text of template glued from params.
 
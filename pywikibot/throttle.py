@@ -11,11 +11,12 @@ __version__ = '$Id: ffd43675f7d175420e1cd49c6aef4135f78e13bf $'
 #
 
 import math
+import sqlite3
 import threading
 import time
 
 import pywikibot
-from pywikibot import config
+from pywikibot import config, stats
 
 _logger = "wiki.throttle"
 
@@ -37,12 +38,19 @@ class Throttle(object):
     Each Site initiates one Throttle object (site.throttle) to control the
     rate of access.
 
+    If config.adaptive_throttle is True, the read and write delays are
+    adjusted to the server's responses: they are increased
+    multiplicatively after maxlag errors, Retry-After headers and slow
+    responses, and decreased additively after fast responses (AIMD). The
+    delays never fall below their nominal values and never exceed
+    maxdelay.
+
     """
     def __init__(self, site, mindelay=None, maxdelay=None, writedelay=None,
                  multiplydelay=True):
         self.lock = threading.RLock()
         self.mysite = str(site)
-        self.ctrlfilename = config.datafilepath('throttle.ctrl')
+        self.ctrlfilename = config.datafilepath('throttle.db')
         self.mindelay = mindelay
         if self.mindelay is None:
             self.mindelay = config.minthrottle
@@ -68,71 +76,70 @@ class Throttle(object):
         self.lastwait = 0.0
         self.delay = 0
         self.checktime = 0
+        self.adaptive = config.adaptive_throttle
+        # seconds subtracted from the delays after each fast response
+        self.decrease_step = 0.1
+        # time of the last multiplicative increase of the delays
+        self.last_increase = 0.0
         self.multiplydelay = multiplydelay
         if self.multiplydelay:
             self.checkMultiplicity()
         self.setDelays()
 
+    def _connect(self):
+        """Open the process table in the throttle control database."""
+        conn = sqlite3.connect(self.ctrlfilename, timeout=60,
+                               isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS processes ("
+                     "pid INTEGER NOT NULL, site TEXT NOT NULL, "
+                     "time REAL NOT NULL, PRIMARY KEY (pid, site))")
+        return conn
+
     def checkMultiplicity(self):
-        """Count running processes for site and set process_multiplicity."""
+        """Count running processes for site and set process_multiplicity.
+
+        The processes are registered in an SQLite database, which is
+        locked while it is updated, so that concurrent bot processes
+        cannot lose each other's entries.
+
+        """
         global pid
         self.lock.acquire()
         mysite = self.mysite
         pywikibot.debug(u"Checking multiplicity: pid = %(pid)s" % globals(),
                         _logger)
         try:
-            processes = []
-            my_pid = pid or 1  # start at 1 if global pid not yet set
             count = 1
-            # open throttle.log
             try:
-                f = open(self.ctrlfilename, 'r')
-            except IOError:
+                conn = self._connect()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    now = time.time()
+                    # drop expired processes
+                    conn.execute("DELETE FROM processes WHERE time < ?",
+                                 (now - self.releasepid, ))
+                    if not pid:
+                        # next unused process id, starting at 1
+                        pid = conn.execute(
+                            "SELECT COALESCE(MAX(pid), 0) + 1 "
+                            "FROM processes").fetchone()[0]
+                    count += conn.execute(
+                        "SELECT COUNT(*) FROM processes WHERE site = ? "
+                        "AND pid != ? AND time >= ?",
+                        (mysite, pid, now - self.dropdelay)).fetchone()[0]
+                    self.checktime = now
+                    conn.execute("INSERT OR REPLACE INTO processes "
+                                 "(pid, site, time) VALUES (?, ?, ?)",
+                                 (pid, mysite, now))
+                    conn.execute("COMMIT")
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                pywikibot.warning(u"Could not update %s: %s"
+                                  % (self.ctrlfilename, e))
                 if not pid:
-                    pass
-                else:
-                    raise
-            else:
-                now = time.time()
-                for line in f.readlines():
-                    # parse line; format is "pid timestamp site"
-                    try:
-                        line = line.split(' ')
-                        this_pid = int(line[0])
-                        ptime = int(line[1].split('.')[0])
-                        this_site = line[2].rstrip()
-                    except (IndexError, ValueError):
-                        # Sometimes the file gets corrupted ignore that line
-                        continue
-                    if now - ptime > self.releasepid:
-                        continue    # process has expired, drop from file
-                    if now - ptime <= self.dropdelay \
-                       and this_site == mysite \
-                       and this_pid != pid:
-                        count += 1
-                    if this_site != self.mysite or this_pid != pid:
-                        processes.append({'pid': this_pid,
-                                          'time': ptime,
-                                          'site': this_site})
-                    if not pid and this_pid >= my_pid:
-                        my_pid = this_pid + 1  # next unused process id
-                f.close()
-
-            if not pid:
-                pid = my_pid
-            self.checktime = time.time()
-            processes.append({'pid': pid,
-                              'time': self.checktime,
-                              'site': mysite})
-            processes.sort(key=lambda p: (p['pid'], p['site']))
-            try:
-                f = open(self.ctrlfilename, 'w')
-                for p in processes:
-                    f.write("%(pid)s %(time)s %(site)s\n" % p)
-            except IOError:
-                pass
-            else:
-                f.close()
+                    pid = 1
+                self.checktime = time.time()
             self.process_multiplicity = count
             pywikibot.log(u"Found %(count)s %(mysite)s processes "
                           u"running, including this one." % locals())
@@ -153,6 +160,9 @@ class Throttle(object):
             self.delay = delay
             self.writedelay = min(max(self.mindelay, writedelay),
                                   self.maxdelay)
+            # lower bounds for the adaptive delays
+            self.nominal_delay = self.delay
+            self.nominal_writedelay = self.writedelay
             # Start the delay count now, not at the next check
             self.last_read = self.last_write = time.time()
         finally:
@@ -199,35 +209,17 @@ class Throttle(object):
         """Remove me from the list of running bot processes."""
         # drop all throttles with this process's pid, regardless of site
         self.checktime = 0
-        processes = []
-        try:
-            f = open(self.ctrlfilename, 'r')
-        except IOError:
+        if not pid:
             return
-        else:
-            now = time.time()
-            for line in f.readlines():
-                try:
-                    line = line.split(' ')
-                    this_pid = int(line[0])
-                    ptime = int(line[1].split('.')[0])
-                    this_site = line[2].rstrip()
-                except (IndexError, ValueError):
-                    # Sometimes the file gets corrupted ignore that line
-                    continue
-                if now - ptime <= self.releasepid \
-                   and this_pid != pid:
-                    processes.append({'pid': this_pid,
-                                      'time': ptime,
-                                      'site': this_site})
-        processes.sort(key=lambda p: p['pid'])
         try:
-            f = open(self.ctrlfilename, 'w')
-            for p in processes:
-                f.write("%(pid)s %(time)s %(site)s\n" % p)
-        except IOError:
-            return
-        f.close()
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM processes WHERE pid = ?", (pid, ))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            pywikibot.warning(u"Could not update %s: %s"
+                              % (self.ctrlfilename, e))
 
     def wait(self, seconds):
         """Wait for seconds seconds.
@@ -256,8 +248,10 @@ class Throttle(object):
         Parameter requestsize is the number of Pages to be read/written;
         multiply delay time by an appropriate factor.
 
-        Because this seizes the throttle lock, it will prevent any other
-        thread from writing to the same site until the wait expires.
+        Reads and writes are scheduled separately. Each call reserves the
+        next free slot while holding the throttle lock, then sleeps until
+        that slot without the lock, so that other threads can reserve the
+        following slots in the meantime.
 
         """
         self.lock.acquire()
@@ -270,27 +264,103 @@ class Throttle(object):
             # the delay time for the server.
             self.next_multiplicity = math.log(1 + requestsize) / math.log(2.0)
 
-            self.wait(wait)
-
+            # reserve the slot, so the next caller waits for the one after
             if write:
-                self.last_write = time.time()
+                self.last_write = time.time() + wait
             else:
-                self.last_read = time.time()
+                self.last_read = time.time() + wait
         finally:
             self.lock.release()
 
+        self.wait(wait)
+
+    def _increase_delays(self, minimum, factor=2.0):
+        """Increase the delays multiplicatively, to at least minimum.
+
+        The delays are multiplied at most once within the read delay, so
+        that one lag event increases them once, even if it is reported by
+        the responses of several threads, or by both the Retry-After header
+        and the maxlag error of one response.
+
+        """
+        self.lock.acquire()
+        try:
+            now = time.time()
+            if now - self.last_increase < self.delay:
+                factor = 1.0
+            else:
+                self.last_increase = now
+            self.delay = min(max(self.delay * factor, minimum),
+                             self.maxdelay)
+            self.writedelay = min(max(self.writedelay * factor, minimum),
+                                  self.maxdelay)
+            self._sample_delays()
+        finally:
+            self.lock.release()
+
+    def _sample_delays(self):
+        stats.sample(self.mysite, 'read_delay', self.delay)
+        stats.sample(self.mysite, 'write_delay', self.writedelay)
+
+    def feedback(self, latency):
+        """Adapt the delays to the latency of a successful request.
+
+        Responses slower than config.adaptive_throttle_latency seconds
+        increase the delays by half, faster ones decrease them by
+        decrease_step seconds. Has no effect unless the throttle is
+        adaptive.
+
+        @param latency: the response time of the request in seconds
+
+        """
+        if not self.adaptive:
+            return
+        if latency > config.adaptive_throttle_latency:
+            self._increase_delays(self.decrease_step, 1.5)
+            return
+        self.lock.acquire()
+        try:
+            if self.delay > self.nominal_delay or \
+                    self.writedelay > self.nominal_writedelay:
+                self.delay = max(self.delay - self.decrease_step,
+                                 self.nominal_delay)
+                self.writedelay = max(self.writedelay - self.decrease_step,
+                                      self.nominal_writedelay)
+                self._sample_delays()
+        finally:
+            self.lock.release()
+
+    def retry_after(self, seconds):
+        """Slow down because the server asked to retry after seconds.
+
+        Has no effect unless the throttle is adaptive; then the delays are
+        increased to at least seconds.
+
+        """
+        if self.adaptive:
+            self._increase_delays(seconds)
+
     def lag(self, lagtime):
-        """Seize the throttle lock due to server lag.
+        """Wait due to server lag.
 
-        This will prevent any thread from accessing this site.
+        Unless the throttle is adaptive, this seizes the throttle lock,
+        which prevents any thread from accessing this site meanwhile.
+
+        An adaptive throttle does not block other threads; it doubles its
+        delays instead, so that all threads slow down until the lag is gone,
+        and only the calling thread waits before retrying.
 
         """
+        # start at 1/2 the current server lag time
+        # wait at least 5 seconds but not more than 120 seconds
+        delay = min(max(5, lagtime // 2), 120)
+        if self.adaptive:
+            self._increase_delays(1.0)
+            self.wait(delay)
+            return
         started = time.time()
         self.lock.acquire()
         try:
-            # start at 1/2 the current server lag time
-            # wait at least 5 seconds but not more than 120 seconds
-            delay = min(max(5, lagtime // 2), 120)
             # account for any time we waited while acquiring the lock
             wait = delay - (time.time() - started)
 
@@ -7,9 +7,9 @@
 #
 __version__ = '$Id: 6f0c26cf5fcaa8dd2afc9f6b4a3d53ef38204faf $'
 
+import collections
 import sys
 import threading
-import time
 
 if sys.version_info[0] > 2:
     import queue as Queue
@@ -108,40 +108,256 @@ class ThreadedGenerator(threading.Thread):
         self.queue = Queue.Queue(qsize)
         self.finished = threading.Event()
 
+    # put on the queue after the last result
+    _done = object()
+
     def __iter__(self):
         """Iterate results from the queue."""
         if not self.isAlive() and not self.finished.isSet():
             self.start()
-        # if there is an item in the queue, yield it, otherwise wait
+        # wait for the next item on the queue; the generator thread puts
+        # _done after the last one
         while not self.finished.isSet():
             try:
-                yield self.queue.get(True, 0.25)
-            except Queue.Empty:
-                pass
+                item = self.queue.get()
             except KeyboardInterrupt:
                 self.stop()
+                return
+            if item is self._done or self.finished.isSet():
+                self.stop()
+                return
+            yield item
 
     def stop(self):
         """Stop the background thread."""
         self.finished.set()
+        # Drop the items which won't be used anymore. This makes space for
+        # the one item the generator thread may still put before it sees
+        # that it has been stopped, so that it never blocks for good.
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Queue.Empty:
+            pass
+        if not self.isAlive():
+            # wake up a consumer in another thread, which would otherwise
+            # wait for an item from the generator thread
+            try:
+                self.queue.put_nowait(self._done)
+            except Queue.Full:
+                pass
 
     def run(self):
         """Run the generator and store the results on the queue."""
-        self.__gen = self.generator(*self.args, **self.kwargs)
-        for result in self.__gen:
-            while True:
+        try:
+            self.__gen = self.generator(*self.args, **self.kwargs)
+            for result in self.__gen:
+                self.queue.put(result)
                 if self.finished.isSet():
                     return
-                try:
-                    self.queue.put_nowait(result)
-                except Queue.Full:
-                    time.sleep(0.25)
-                    continue
-                break
-        # wait for queue to be emptied, then kill the thread
-        while not self.finished.isSet() and not self.queue.empty():
-            time.sleep(0.25)
-        self.stop()
+        finally:
+            if not self.finished.isSet():
+                self.queue.put(self._done)
+
+
+class Future(object):
+
+    """Placeholder for the result of a call executed in another thread.
+
+    This is a small subset of concurrent.futures.Future, which is not
+    available in Python 2.
+
+    >>> future = Future()
+    >>> future.set_result(42)
+    >>> future.done()
+    True
+    >>> future.result()
+    42
+
+    """
+
+    def __init__(self):
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        """Return True if the result or an exception has been set."""
+        return self._finished.isSet()
+
+    def result(self, timeout=None):
+        """Return the result of the call, waiting for it if necessary.
+
+        If the call raised an exception, this method raises it too.
+
+        @param timeout: maximum number of seconds to wait; wait forever
+            if None
+        @raise RuntimeError: the result is not available within timeout
+
+        """
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Return the exception raised by the call, or None.
+
+        @param timeout: maximum number of seconds to wait; wait forever
+            if None
+        @raise RuntimeError: the result is not available within timeout
+
+        """
+        self._finished.wait(timeout)
+        if not self._finished.isSet():
+            raise RuntimeError("Result not available within %s seconds."
+                               % timeout)
+        return self._exception
+
+    def add_done_callback(self, fn):
+        """Call fn with this future as its only argument once it is done.
+
+        If the future is already done, fn is called immediately.
+
+        """
+        self._lock.acquire()
+        try:
+            if not self._finished.isSet():
+                self._callbacks.append(fn)
+                return
+        finally:
+            self._lock.release()
+        fn(self)
+
+    def set_result(self, result):
+        """Store the result of the call and wake up waiting threads."""
+        self._result = result
+        self._set_finished()
+
+    def set_exception(self, exception):
+        """Store the exception raised by the call and wake up waiting threads."""
+        self._exception = exception
+        self._set_finished()
+
+    def _set_finished(self):
+        self._lock.acquire()
+        try:
+            self._finished.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for fn in callbacks:
+            fn(self)
+
+
+class ThreadPool(object):
+
+    """A fixed number of daemon threads executing submitted calls.
+
+    The threads are started with the first submitted call.
+
+    >>> pool = ThreadPool(workers=2)
+    >>> future = pool.submit(sum, [1, 2, 3])
+    >>> future.result()
+    6
+
+    """
+
+    def __init__(self, workers=4, name="PoolThread", maxsize=0):
+        """Constructor.
+
+        @param workers: the number of threads
+        @type workers: int
+        @param name: the name prefix of the threads
+        @type name: str
+        @param maxsize: if positive, the number of calls which may wait for
+            a thread; submitting further calls blocks until a thread is
+            available
+        @type maxsize: int
+
+        """
+        self.workers = max(1, workers)
+        self.name = name
+        self.queue = Queue.Queue(maxsize)
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule func(*args, **kwargs) to be executed by a pool thread.
+
+        @return: the future holding the result of the call
+        @rtype: Future
+
+        """
+        self._start()
+        future = Future()
+        self.queue.put((future, func, args, kwargs))
+        return future
+
+    def imap(self, func, iterable, ahead=None):
+        """Yield func(item) for each item of iterable, computed by the threads.
+
+        The results are yielded in the order of iterable. Up to ahead calls
+        are submitted before the first of them is yielded, so several
+        generators in a pipeline can share a pool without one of them
+        taking all of its threads.
+
+        >>> pool = ThreadPool(workers=2)
+        >>> list(pool.imap(abs, [-1, 2, -3]))
+        [1, 2, 3]
+
+        @param ahead: the maximum number of pending calls; defaults to the
+            number of threads
+        @type ahead: int
+
+        """
+        if ahead is None:
+            ahead = self.workers
+        pending = collections.deque()
+        for item in iterable:
+            pending.append(self.submit(func, item))
+            if len(pending) >= max(1, ahead):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def shutdown(self):
+        """Stop the threads once the calls already submitted are done."""
+        self.lock.acquire()
+        try:
+            for thd in self.threads:
+                self.queue.put(None)
+            self.threads = []
+        finally:
+            self.lock.release()
+
+    def _start(self):
+        self.lock.acquire()
+        try:
+            while len(self.threads) < self.workers:
+                thd = threading.Thread(
+                    target=self._work,
+                    name="%s-%d" % (self.name, len(self.threads)))
+                thd.setDaemon(True)
+                self.threads.append(thd)
+                thd.start()
+        finally:
+            self.lock.release()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            future, func, args, kwargs = item
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
 
 
 def itergroup(iterable, size):
@@ -194,8 +410,11 @@ class ThreadList(list):
         self.limit = limit
         list.__init__(self, *args)
         for item in list(self):
-            if not isinstance(threading.Thread, item):
+            if not isinstance(item, threading.Thread):
                 raise TypeError("Cannot add '%s' to ThreadList" % type(item))
+        # number of appended threads which are still running
+        self.running = 0
+        self.cond = threading.Condition()
 
     def active_count(self):
         """Return the number of alive threads, and delete all non-alive ones."""
@@ -210,11 +429,31 @@ class ThreadList(list):
     def append(self, thd):
         if not isinstance(thd, threading.Thread):
             raise TypeError("Cannot append '%s' to ThreadList" % type(thd))
-        while self.active_count() >= self.limit:
-            time.sleep(2)
+        self.cond.acquire()
+        try:
+            while self.running >= self.limit:
+                self.cond.wait()
+            self.running += 1
+        finally:
+            self.cond.release()
+        self.active_count()
         list.append(self, thd)
+        thd.run = self._wrap(thd.run)
         thd.start()
 
+    def _wrap(self, run):
+        """Return run() followed by a notification of waiting appenders."""
+        def wrapper():
+            try:
+                run()
+            finally:
+                self.cond.acquire()
+                try:
+                    self.running -= 1
+                    self.cond.notify()
+                finally:
+                    self.cond.release()
+        return wrapper
 
 if __name__ == "__main__":
     def _test():
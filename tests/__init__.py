@@ -0,0 +1,8 @@
+# -*- coding: utf-8  -*-
+"""Tests for the pywikibot package."""
+#
+# (C) Pywikibot team, 2014
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
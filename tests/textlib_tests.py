@@ -0,0 +1,247 @@
+# -*- coding: utf-8  -*-
+"""Tests for textlib."""
+#
+# (C) Pywikibot team, 2014
+#
+# Distributed under the terms of the MIT license.
+#
+__version__ = '$Id$'
+
+import unittest
+
+import pywikibot
+from pywikibot import textlib
+from pywikibot.site import BaseSite
+
+
+class TestTemplateParams(unittest.TestCase):
+
+    """Compare extract_templates_and_params_tokenized with the regex version.
+
+    The tokenizer is the fallback of extract_templates_and_params if
+    mwparserfromhell isn't available, so it must return the same as
+    extract_templates_and_params_regex, except for the cases listed in
+    test_differences.
+
+    """
+
+    # texts on which both functions agree, and their templates
+    same = [
+        (u'{{a}}', [(u'a', {})]),
+        (u'text {{a|b}} more', [(u'a', {u'1': u'b'})]),
+        (u'{{a|b=c}}', [(u'a', {u'b': u'c'})]),
+        (u'{{a|b=}}', [(u'a', {u'b': u''})]),
+        (u'{{a|b|c=d|e}}', [(u'a', {u'1': u'b', u'c': u'd', u'2': u'e'})]),
+        (u'{{ a \n| b = c \n}}', [(u'a', {u'b': u'c'})]),
+        (u'{{a|1=x|1=y}}', [(u'a', {u'1': u'y'})]),
+        (u'{{a|\xe9}}', [(u'a', {u'1': u'\xe9'})]),
+        (u'{{a|b|}}', [(u'a', {u'1': u'b', u'2': u''})]),
+        (u'{{a||b}}', [(u'a', {u'1': u'', u'2': u'b'})]),
+        (u'{{msg:a|b}}', [(u'a', {u'1': u'b'})]),
+        (u'{{DEFAULTSORT:x}}', [(u'DEFAULTSORT:x', {})]),
+        (u'{{#if:x|y}}', []),
+        # nested templates: innermost first, and each one once
+        (u'{{a|{{b|c}}}}', [(u'b', {u'1': u'c'}),
+                            (u'a', {u'1': u'{{b|c}}'})]),
+        (u'{{a|b={{c|d=e}}|f}}', [(u'c', {u'd': u'e'}),
+                                  (u'a', {u'1': u'f', u'b': u'{{c|d=e}}'})]),
+        (u'{{a|{{b|c}}|{{b|c}}}}', [(u'b', {u'1': u'c'}),
+                                    (u'a', {u'1': u'{{b|c}}',
+                                            u'2': u'{{b|c}}'})]),
+        (u'{{a}}{{a}}', [(u'a', {})]),
+        (u'{{a|{{b}}}}{{b}}', [(u'b', {}), (u'a', {u'1': u'{{b}}'})]),
+        # links, math, template parameters and disabled parts
+        (u'{{a|[[b|c]]}}', [(u'a', {u'1': u'[[b|c]]'})]),
+        (u'{{a|<math>x|y</math>}}', [(u'a', {u'1': u'<math>x|y</math>'})]),
+        (u'{{a|{{{1|d}}}}}', [(u'a', {u'1': u'{{{1|d}}}'})]),
+        (u'{{a|x}}{{{1}}}', [(u'a', {u'1': u'x'})]),
+        (u'{{a|<!--{{b}}-->c}}', [(u'a', {u'1': u'c'})]),
+        # unbalanced braces
+        (u'{{a', []),
+        (u'a}}', []),
+        (u'{{a|{{b}}', [(u'b', {})]),
+        (u'{{a|b}}}', [(u'a', {u'1': u'b'})]),
+        (u'{{a|{}}}', []),
+        (u'{{{{a}}}}', []),
+    ]
+
+    # texts on which the tokenizer intentionally differs, with the results
+    # of the regex version and of the tokenizer
+    different = [
+        # an empty last parameter is recognized
+        (u'{{a|}}', [], [(u'a', {u'1': u''})]),
+        (u'{{a|<nowiki>{{b}}</nowiki>}}', [], [(u'a', {u'1': u''})]),
+        (u'{{a|{{b|}}}}', [(u'b', {u'1': u'}'})],
+         [(u'b', {u'1': u''}), (u'a', {u'1': u'{{b|}}'})]),
+        (u'{{x|}}}', [(u'x', {u'1': u'}'})], [(u'x', {u'1': u''})]),
+        # a stray closing brace isn't taken as the name of a template
+        (u'{{}}}', [(u'}', {})], []),
+        (u'{{{}}}', [(u'}', {})], []),
+    ]
+
+    def test_same(self):
+        """Test texts on which both functions return the same."""
+        for text, expected in self.same:
+            self.assertEqual(textlib.extract_templates_and_params_regex(text),
+                             expected, text)
+            self.assertEqual(
+                textlib.extract_templates_and_params_tokenized(text),
+                expected, text)
+
+    def test_differences(self):
+        """Test texts on which the tokenizer intentionally differs."""
+        for text, regex, tokenized in self.different:
+            self.assertEqual(textlib.extract_templates_and_params_regex(text),
+                             regex, text)
+            self.assertEqual(
+                textlib.extract_templates_and_params_tokenized(text),
+                tokenized, text)
+
+    def test_fallback(self):
+        """Test that the tokenizer is used without mwparserfromhell."""
+        if textlib.config.use_mwparserfromhell and textlib.mwparserfromhell:
+            self.skipTest('mwparserfromhell is used')
+        text = u'{{a|{{b|}}}}'
+        self.assertEqual(textlib.extract_templates_and_params(text),
+                         textlib.extract_templates_and_params_tokenized(text))
+
+
+class TestIsDisabled(unittest.TestCase):
+
+    """Compare isDisabled with inserting a marker into the text.
+
+    isDisabled looks the index up in the disabled parts of the text, but it
+    must still return whether removeDisabledParts removes a marker inserted
+    at the index, also where the marker breaks a tag.
+
+    """
+
+    texts = [
+        u'',
+        u'a<!--b-->c',
+        u'<!--a--><!--b-->',
+        u'<nowiki>a</nowiki> <NOWIKI>b</nowiki>',
+        u'<!--a-->b-->',
+        u'<!--a<!--b-->',
+        u'<!--a--',
+        u'<nowiki><!--</nowiki>-->',
+        u'<nowiki><!--</nowiki>--><nowiki>',
+        u'<!--<nowiki>--></nowiki>',
+        u'<pre><!--</pre><nowiki>--></nowiki>',
+        u'<nowiki><pre></nowiki><!--</pre>-->',
+        u'<source lang=x>a</source><syntaxhighlight x>b</syntaxhighlight>',
+        u'<includeonly><!--</includeonly>--></includeonly>',
+        u'<!-- <!--> -->',
+    ]
+
+    tagsets = [['*'], ['comments'], ['nowiki', 'pre'], ['source']]
+
+    def test_marker(self):
+        """Test each index of the texts."""
+        for text in self.texts:
+            marker = textlib.findmarker(text)
+            for tags in self.tagsets:
+                for index in range(len(text) + 1):
+                    marked = text[:index] + marker + text[index:]
+                    self.assertEqual(
+                        textlib.isDisabled(text, index, tags),
+                        marker not in textlib.removeDisabledParts(marked,
+                                                                  tags),
+                        (text, index, tags))
+
+
+class DummySite(BaseSite):
+
+    """A site with the built-in namespaces, which never accesses the wiki."""
+
+    def __init__(self):
+        BaseSite.__init__(self, 'en', 'wikipedia')
+        self._namespaces = {0: [u''], 10: [u'Template'], 14: [u'Category']}
+
+    def namespace(self, num, all=False):
+        if all:
+            return self._namespaces[num]
+        return self._namespaces[num][0]
+
+    def case(self):
+        return 'first-letter'
+
+
+class TestParsedText(unittest.TestCase):
+
+    """Test ParsedText and the textlib functions given a page."""
+
+    text = (u'a<!--c-->{{t|{{u}}}}[[Category:A|k]]'
+            u'<nowiki>[[x]]</nowiki>[[Category:<!--x-->B]]')
+
+    def setUp(self):
+        self.site = DummySite()
+        self.page = pywikibot.Page(self.site, u'Test')
+        self.page.text = self.text
+
+    def test_spans(self):
+        """Test the spans of the markup."""
+        parsed = textlib.ParsedText(self.text, self.site)
+        self.assertEqual(parsed.disabled, [(1, 9), (36, 58), (69, 77)])
+        self.assertEqual(parsed.comments, [(1, 9), (69, 77)])
+        self.assertEqual(parsed.nowiki, [(36, 58)])
+        self.assertEqual(parsed.templates, [(9, 20), (13, 18)])
+        self.assertEqual(parsed.links, [(20, 36), (58, 80)])
+        self.assertEqual(parsed.categories, [(20, 36), (58, 80)])
+        self.assertEqual(parsed.interwikis, [])
+
+    def test_page_results(self):
+        """Test that a page gives the same results as its text."""
+        self.assertEqual(textlib.removeDisabledParts(self.page),
+                         textlib.removeDisabledParts(self.text))
+        self.assertEqual(textlib.removeDisabledParts(self.page, ['nowiki']),
+                         textlib.removeDisabledParts(self.text, ['nowiki']))
+        self.assertEqual(textlib.extract_templates_and_params(self.page),
+                         textlib.extract_templates_and_params(self.text))
+        self.assertEqual(
+            [(cat.title(), cat.sortKey)
+             for cat in textlib.getCategoryLinks(self.page)],
+            [(u'Category:A', u'k'), (u'Category:B', None)])
+
+    def test_text_changes(self):
+        """Test that setting or deleting the text drops the parsed text."""
+        parsed = self.page.parsed_text
+        self.assertIs(self.page.parsed_text, parsed)
+        self.page.text = u'{{v}}'
+        self.assertIsNot(self.page.parsed_text, parsed)
+        self.assertEqual(textlib.extract_templates_and_params(self.page),
+                         [(u'v', {})])
+        parsed = self.page.parsed_text
+        del self.page.text
+        self.page.get = lambda **kwargs: u'[[Category:C]]'
+        self.assertIsNot(self.page.parsed_text, parsed)
+        self.assertEqual(textlib.extract_templates_and_params(self.page), [])
+        self.assertEqual([cat.title()
+                          for cat in textlib.getCategoryLinks(self.page)],
+                         [u'Category:C'])
+
+    def test_fresh_copies(self):
+        """Test that callers may change the results they are given."""
+        parsed = self.page.parsed_text
+        parsed.disabled.append((0, 1))
+        parsed.templates.pop()
+        self.assertEqual(parsed.disabled, [(1, 9), (36, 58), (69, 77)])
+        self.assertEqual(parsed.templates, [(9, 20), (13, 18)])
+        templates = textlib.extract_templates_and_params(self.page)
+        templates[0][1][u'2'] = u'x'
+        templates.pop()
+        self.assertEqual(textlib.extract_templates_and_params(self.page),
+                         [(u'u', {}), (u't', {u'1': u'{{u}}'})])
+        categories = textlib.getCategoryLinks(self.page)
+        categories[0].sortKey = u'z'
+        categories.pop()
+        again = textlib.getCategoryLinks(self.page)
+        self.assertEqual([cat.sortKey for cat in again], [u'k', None])
+        self.assertIsNot(again[0], categories[0])
+
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except SystemExit:
+        pass